@@ -0,0 +1,270 @@
+# fakes.py
+# In-process stand-ins for gspread, Google Drive and Gemini with configurable latency, plus a synthetic sheet generator.
+
+import re
+import json
+import time
+import random
+import threading
+from types import SimpleNamespace
+
+from payer_index import PayerIndex
+from portal_server import ERROR_PREFIX, IRREGULAR_PREFIX, FIELD_PREFIX, DOS_FIELD, load_fixture, jittered
+
+# Payer names as people type them on the sheet; most resolve locally, a few need the candidate prompt.
+SHEET_PAYER_NAMES = [
+    "Aetna", "Cigna", "Humana", "UHC", "UMR", "United Healthcare", "Oscar",
+    "BCBS North Carolina", "BCBS NC", "BCBS TX", "Anthem CA",
+    "Medicare", "Medicaid NC", "Tricare",
+]
+FIRST_NAMES = ["James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Wilson", "Moore"]
+
+NUM_COLUMNS = 10 # A:J
+A1_RE = re.compile(r"^([A-Z]+)(\d+)?(?::([A-Z]+)(\d+)?)?$")
+
+
+def make_sheet_rows(count: int, seed: int = 7, duplicate_rate: float = 0.05, error_rate: float = 0.02,
+                    irregular_rate: float = 0.05, payers: list = None) -> list:
+    """Builds `count` pending rows (A:F filled, G:J empty) with a repeatable mix of payers and edge cases."""
+    rng = random.Random(seed)
+    payers = payers or SHEET_PAYER_NAMES
+    rows = []
+    for n in range(count):
+        if rows and rng.random() < duplicate_rate:
+            rows.append(list(rng.choice(rows)))
+            continue
+        roll = rng.random()
+        prefix = ERROR_PREFIX if roll < error_rate else IRREGULAR_PREFIX if roll < error_rate + irregular_rate else "M"
+        rows.append([
+            f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/2025",
+            rng.choice(FIRST_NAMES),
+            rng.choice(LAST_NAMES),
+            f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(1940, 2015)}",
+            rng.choice(payers),
+            f"{prefix}{rng.randint(10 ** 8, 10 ** 9 - 1)}",
+        ])
+    return rows
+
+
+def _column_index(letters: str) -> int:
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+# --- Google Sheets ---
+
+class FakeWorksheet:
+    """
+    The subset of gspread.Worksheet the bot uses (get, acell, update, batch_update), kept in memory.
+    `version` increases on every write, like the spreadsheet's Drive version.
+    """
+
+    def __init__(self, rows: list, latency: float = 0.3, header: list = None):
+        self.grid = [list(header or ["DOS", "First Name", "Last Name", "DOB", "Payer", "Member ID",
+                                     "Status", "Policy Begin", "Policy End", "Screenshot"])]
+        self.grid += [list(row) + [""] * (NUM_COLUMNS - len(row)) for row in rows]
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.version = 1
+
+    def _api(self, name: str):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        time.sleep(jittered(self.latency))
+
+    def _bounds(self, range_name: str):
+        match = A1_RE.match(range_name)
+        if not match:
+            raise ValueError(f"Unsupported range: {range_name}")
+        first_col, first_row, last_col, last_row = match.groups()
+        first_row = int(first_row or 1)
+        last_col = last_col or first_col
+        last_row = int(last_row) if last_row else (first_row if match.group(3) is None else len(self.grid))
+        return first_row, _column_index(first_col), last_row, _column_index(last_col)
+
+    def _write(self, range_name: str, values: list):
+        self.version += 1
+        first_row, first_col, _, _ = self._bounds(range_name)
+        for r, row_values in enumerate(values):
+            while len(self.grid) < first_row + r:
+                self.grid.append([""] * NUM_COLUMNS)
+            target = self.grid[first_row + r - 1]
+            for c, value in enumerate(row_values):
+                target[first_col + c] = "" if value is None else str(value)
+
+    def get(self, range_name: str):
+        self._api("get")
+        with self.lock:
+            first_row, first_col, last_row, last_col = self._bounds(range_name)
+            values = []
+            for row in self.grid[first_row - 1:last_row]:
+                cells = row[first_col:last_col + 1]
+                while cells and cells[-1] == "":
+                    cells.pop()
+                values.append(cells)
+            while values and not values[-1]:
+                values.pop()
+            return values
+
+    def acell(self, label: str):
+        self._api("acell")
+        with self.lock:
+            row, col, _, _ = self._bounds(label)
+            value = self.grid[row - 1][col] if row <= len(self.grid) else ""
+            return SimpleNamespace(value=value or None)
+
+    def update(self, values=None, range_name=None):
+        self._api("update")
+        with self.lock:
+            self._write(range_name, values)
+
+    def batch_update(self, data: list):
+        self._api("batch_update")
+        with self.lock:
+            for item in data:
+                self._write(item["range"], item["values"])
+
+    def snapshot(self) -> list:
+        """Data rows (without the header) as they stand right now."""
+        with self.lock:
+            return [list(row) for row in self.grid[1:]]
+
+
+class FakeGspread:
+    """Stands in for the gspread module inside bot.py: authorize(creds).open_by_key(id).worksheet(name)."""
+
+    def __init__(self, worksheet: FakeWorksheet, exceptions):
+        self.worksheet = worksheet
+        self.exceptions = exceptions
+
+    def authorize(self, creds):
+        spreadsheet = SimpleNamespace(worksheet=lambda name: self.worksheet)
+        return SimpleNamespace(open_by_key=lambda key: spreadsheet)
+
+
+# --- Google Drive ---
+
+class _Request:
+    def __init__(self, drive, result):
+        self.drive = drive
+        self.result = result
+
+    def execute(self):
+        self.drive.api_call()
+        return self.result
+
+
+class FakeDrive:
+    """
+    files().create() and permissions().create() with latency; hands out fake webViewLinks.
+    files().get() reports the watched worksheet's version for the bot's change probe.
+    """
+
+    def __init__(self, latency: float = 0.8, worksheet: FakeWorksheet = None):
+        self.latency = latency
+        self.worksheet = worksheet
+        self.lock = threading.Lock()
+        self.uploads = 0
+        self.calls = 0
+
+    def api_call(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(jittered(self.latency))
+
+    def files(self):
+        return SimpleNamespace(create=self._create_file, get=self._get_file)
+
+    def permissions(self):
+        return SimpleNamespace(create=lambda fileId=None, body=None: _Request(self, {"id": fileId}))
+
+    def _create_file(self, body=None, media_body=None, fields=None):
+        with self.lock:
+            self.uploads += 1
+            file_id = f"fake-{self.uploads}"
+        return _Request(self, {"id": file_id, "webViewLink": f"https://drive.example.invalid/file/d/{file_id}/view"})
+
+    def _get_file(self, fileId=None, fields=None):
+        version = self.worksheet.version if self.worksheet is not None else 1
+        return _Request(self, {"id": fileId, "version": str(version)})
+
+    def build(self, service_name, version, credentials=None, **kwargs):
+        """Drop-in for googleapiclient.discovery.build."""
+        return self
+
+
+# --- Gemini ---
+
+JSON_BLOCK_RE = re.compile(r"```json\s*(.*?)```", re.S)
+TARGET_PAYER_RE = re.compile(r'\*\*"(.+?)"\*\*')
+DATE_RE = re.compile(r"\d{1,2}/\d{1,2}/\d{4}")
+
+FORM_PLAN_FIELDS = [
+    (DOS_FIELD, "dos"),
+    (DOS_FIELD + "End", "dos"),
+    (FIELD_PREFIX + "InsuranceNum", "member_id"),
+    (FIELD_PREFIX + "InsuredFirstName", "first_name"),
+    (FIELD_PREFIX + "InsuredLastName", "last_name"),
+    (FIELD_PREFIX + "InsuredDob", "dob"),
+]
+
+
+class FakeGeminiModel:
+    """Answers the bot's three prompt types (payer choice, form plan, report parse) after a simulated delay."""
+
+    def __init__(self, latency: float, payer_index: PayerIndex, stats: dict, lock):
+        self.latency = latency
+        self.payer_index = payer_index
+        self.stats = stats
+        self.lock = lock
+
+    def generate_content(self, prompt, generation_config=None, request_options=None):
+        kind, answer = self._answer(prompt)
+        with self.lock:
+            self.stats[kind] = self.stats.get(kind, 0) + 1
+            self.stats["prompt_bytes"] = self.stats.get("prompt_bytes", 0) + len(prompt.encode("utf-8"))
+        time.sleep(jittered(self.latency))
+        return SimpleNamespace(text=json.dumps(answer))
+
+    def _answer(self, prompt: str):
+        if "Candidates:" in prompt:
+            candidates = json.loads(JSON_BLOCK_RE.search(prompt).group(1))
+            return "payer_candidates", candidates[0]
+        if "Payer List HTML" in prompt:
+            target = TARGET_PAYER_RE.search(prompt).group(1)
+            best, candidates = self.payer_index.resolve(target, min_score=0.0, min_margin=0.0)
+            choice = best or (candidates[0] if candidates else {"category_text": "", "payer_text": target})
+            return "payer_full_list", {"category_text": choice["category_text"], "payer_text": choice["payer_text"]}
+        if "Form HTML" in prompt:
+            patient = json.loads(JSON_BLOCK_RE.search(prompt).group(1))
+            return "form_plan", [{"selector": f"#{field_id}", "value": patient[key]} for field_id, key in FORM_PLAN_FIELDS]
+        if "insurance report" in prompt:
+            report = prompt.split("Report:", 1)[-1]
+            status = re.search(r"\b(Active|Inactive)\b", report)
+            dates = DATE_RE.findall(report.split("Vision")[0])
+            # Subscriber DOB comes first in the report; the plan dates follow it.
+            dates = dates[-2:] if len(dates) >= 2 else ["Not Found", "Not Found"]
+            return "report_parse", {"status": status.group(1) if status else "Not Found",
+                                    "policy_begin": dates[0], "policy_end": dates[1]}
+        return "other", {}
+
+
+class FakeGenAI:
+    """Stands in for the google.generativeai module inside gemini_client.py."""
+
+    def __init__(self, latency: float = 1.5):
+        self.latency = latency
+        self.payer_index = PayerIndex()
+        self.payer_index.build_from_html(load_fixture("eligibility.html"))
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def configure(self, api_key=None, **kwargs):
+        pass
+
+    def GenerativeModel(self, model_name):
+        return FakeGeminiModel(self.latency, self.payer_index, self.stats, self.lock)
@@ -0,0 +1,149 @@
+# portal_server.py
+# Local stand-in for mytools.gatewayedi.com that serves the recorded HTML fixtures with configurable latency.
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Member IDs with these prefixes make the portal answer with a validation error or an irregular report layout.
+ERROR_PREFIX = "ERR"
+IRREGULAR_PREFIX = "ODD"
+
+FIELD_PREFIX = "EligibilityRequestTemplateInquiry_EligibilityRequestFieldValues_"
+DOS_FIELD = "EligibilityRequestPayerInquiry_EligibilityRequestFieldValues_DateOfService"
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURE_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def fill(template: str, **values) -> str:
+    for key, value in values.items():
+        template = template.replace("{{" + key + "}}", str(value))
+    return template
+
+
+def expected_result(member_id: str) -> dict:
+    """The status and plan dates the portal reports for a member, derived deterministically from the ID."""
+    digest = int(hashlib.sha1(member_id.encode("utf-8")).hexdigest(), 16)
+    year = 2024 + digest % 2
+    return {
+        "status": "Inactive" if digest % 5 == 0 else "Active",
+        "policy_begin": f"01/01/{year}",
+        "policy_end": f"12/31/{year}",
+    }
+
+
+def jittered(seconds: float) -> float:
+    return seconds * random.uniform(0.75, 1.25) if seconds > 0 else 0
+
+
+class PortalServer:
+    """
+    Serves the home page, the eligibility page with the payer accordion, per-payer forms and inquiry
+    responses on 127.0.0.1. `page_latency` applies to page and form loads, `inquiry_latency` to submissions.
+    """
+
+    def __init__(self, page_latency: float = 0.3, inquiry_latency: float = 2.0, port: int = 0):
+        self.page_latency = page_latency
+        self.inquiry_latency = inquiry_latency
+        self.fixtures = {name: load_fixture(name) for name in ("home.html", "eligibility.html", "form.html", "report.html")}
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="portal-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _count(self, name: str):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def inquiry_response(self, fields: dict) -> dict:
+        """Builds the JSON the eligibility page's script puts into the errors and report containers."""
+        member_id = fields.get(FIELD_PREFIX + "InsuranceNum", "").strip()
+        first_name = fields.get(FIELD_PREFIX + "InsuredFirstName", "").strip()
+        last_name = fields.get(FIELD_PREFIX + "InsuredLastName", "").strip()
+        dob = fields.get(FIELD_PREFIX + "InsuredDob", "").strip()
+        if not all((member_id, first_name, last_name, dob, fields.get(DOS_FIELD, "").strip())):
+            return {"errors": "All subscriber fields and the date of service are required.", "report": ""}
+        if member_id.startswith(ERROR_PREFIX):
+            return {"errors": f"Subscriber ID {member_id} is not valid for this payer.", "report": ""}
+        result = expected_result(member_id)
+        irregular = member_id.startswith(IRREGULAR_PREFIX)
+        report = fill(
+            self.fixtures["report.html"],
+            payer=fields.get("PayerName", ""), first_name=first_name, last_name=last_name, member_id=member_id, dob=dob,
+            status=result["status"], begin=result["policy_begin"], end=result["policy_end"],
+            status_id="statusValue" if irregular else "trnEligibilityStatus",
+            section="Coverage" if irregular else "Health Benefit Plan Coverage",
+        )
+        return {"errors": "", "report": report}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, body: str, content_type: str = "text/html", status: int = 200):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                path = url.path.rstrip("/").lower()
+                if path in ("", "/default.aspx"):
+                    server._count("home")
+                    time.sleep(jittered(server.page_latency))
+                    self._send(server.fixtures["home.html"])
+                elif path == "/managepatients/realtimeeligibility/index":
+                    server._count("eligibility_page")
+                    time.sleep(jittered(server.page_latency))
+                    self._send(server.fixtures["eligibility.html"])
+                elif path == "/managepatients/realtimeeligibility/form":
+                    server._count("form")
+                    time.sleep(jittered(server.page_latency))
+                    payer = parse_qs(url.query).get("payer", [""])[0]
+                    self._send(fill(server.fixtures["form.html"], payer=payer))
+                else:
+                    self._send("Not Found", "text/plain", 404)
+
+            def do_POST(self):
+                if urlparse(self.path).path.lower() != "/managepatients/realtimeeligibility/inquiry":
+                    self._send("Not Found", "text/plain", 404)
+                    return
+                server._count("inquiry")
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode("utf-8")
+                fields = {key: values[0] for key, values in parse_qs(body, keep_blank_values=True).items()}
+                time.sleep(jittered(server.inquiry_latency))
+                self._send(json.dumps(server.inquiry_response(fields)), "application/json")
+
+        return Handler
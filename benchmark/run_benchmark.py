@@ -0,0 +1,237 @@
+# run_benchmark.py
+# Offline benchmark: runs the real bot.main() against a local portal and fake Sheets, Drive and Gemini backends,
+# then reports rows per minute, per-stage latency and API call counts.
+#
+# Usage (from the repository root):
+#   python benchmark/run_benchmark.py --rows 300
+#   python benchmark/run_benchmark.py --rows 300 --set NUM_WORKERS=1 --set FAST_NAVIGATION=False --output before.json
+
+import os
+import sys
+import ast
+import json
+import time
+import argparse
+import tempfile
+import threading
+import _thread
+import contextlib
+from types import SimpleNamespace
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import gspread
+import bot
+import timing
+import gemini_client
+import screenshot_uploader
+from row_claims import CLAIM_PREFIX
+from fakes import FakeWorksheet, FakeGspread, FakeDrive, FakeGenAI, make_sheet_rows
+from portal_server import PortalServer, ERROR_PREFIX, expected_result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for the eligibility bot.")
+    parser.add_argument("--rows", type=int, default=300, help="Synthetic sheet rows to process")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for the synthetic sheet")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05, help="Share of rows repeating an earlier patient")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="Share of rows the portal rejects")
+    parser.add_argument("--irregular-rate", type=float, default=0.05, help="Share of reports the rules cannot parse confidently")
+    parser.add_argument("--gemini-latency", type=float, default=1.5, help="Seconds per fake Gemini call")
+    parser.add_argument("--sheets-latency", type=float, default=0.3, help="Seconds per fake Sheets call")
+    parser.add_argument("--drive-latency", type=float, default=0.8, help="Seconds per fake Drive call")
+    parser.add_argument("--page-latency", type=float, default=0.3, help="Seconds per portal page or form load")
+    parser.add_argument("--inquiry-latency", type=float, default=2.0, help="Seconds per portal eligibility inquiry")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="Override a bot.py configuration constant, e.g. NUM_WORKERS=1 (repeatable)")
+    parser.add_argument("--work-dir", help="Directory for caches, screenshots and metrics (reuse it to benchmark warm caches)")
+    parser.add_argument("--timeout", type=float, default=3600, help="Give up after this many seconds")
+    parser.add_argument("--output", help="Write the summary as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the bot's own output instead of writing it to bot.log")
+    return parser.parse_args()
+
+
+def parse_override(text: str):
+    name, _, value = text.partition("=")
+    if not name or not hasattr(bot, name):
+        raise SystemExit(f"Unknown bot setting: {name}")
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return name, value
+
+
+def configure_bot(args, work_dir: str, worksheet: FakeWorksheet, drive: FakeDrive, genai: FakeGenAI, portal: PortalServer):
+    """Points bot.py at the local portal, the fakes and the work directory."""
+    bot.gspread = FakeGspread(worksheet, gspread.exceptions)
+    bot.Credentials = SimpleNamespace(from_service_account_file=lambda *args, **kwargs: object())
+    bot.build = drive.build
+    screenshot_uploader.build = drive.build
+    gemini_client.genai = genai
+    bot._gemini_client = None
+    bot.PORTAL_BASE_URL = portal.base_url
+    bot.CHECK_INTERVAL_SECONDS = 1
+
+    bot.STATE_FILE = os.path.join(work_dir, "login_state.json")
+    with open(bot.STATE_FILE, "w") as f:
+        json.dump({"cookies": [], "origins": []}, f)
+    bot.PAYER_CACHE_FILE = os.path.join(work_dir, "payer_cache.json")
+    bot.FORM_PLAN_CACHE_FILE = os.path.join(work_dir, "form_plan_cache.json")
+    bot.RESULT_CACHE_FILE = os.path.join(work_dir, "result_cache.json")
+    bot.CLAIM_LOCK_FILE = os.path.join(work_dir, "row_claims.lock")
+    # Every run starts from a fresh synthetic sheet, so the journal from a previous run must not carry over.
+    bot.WORK_JOURNAL_FILE = os.path.join(work_dir, "work_journal.sqlite3")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(bot.WORK_JOURNAL_FILE + suffix):
+            os.remove(bot.WORK_JOURNAL_FILE + suffix)
+    bot.SCREENSHOT_DIR = os.path.join(work_dir, "Screenshots")
+    bot.METRICS_JSONL_FILE = os.path.join(work_dir, "metrics", "rows.jsonl")
+    bot.METRICS_PROM_FILE = os.path.join(work_dir, "metrics", "eligibility_bot.prom")
+    if os.path.exists(bot.METRICS_JSONL_FILE):
+        os.remove(bot.METRICS_JSONL_FILE)
+
+    for text in args.set:
+        name, value = parse_override(text)
+        setattr(bot, name, value)
+    bot.BROWSER_SLOW_MO = 0 if bot.FAST_NAVIGATION else bot.LEGACY_SLOW_MO_MS
+    if not any(text.startswith("INGEST_PREFETCH_ROWS=") for text in args.set):
+        bot.INGEST_PREFETCH_ROWS = bot.NUM_WORKERS * 2
+
+
+def is_final(row: list) -> bool:
+    status = row[6].strip()
+    return bool(status) and not status.startswith(CLAIM_PREFIX)
+
+
+def watch_sheet(worksheet: FakeWorksheet, started: float, timeout: float, result: dict):
+    """Interrupts bot.main() (as Ctrl+C would) once every row has a final status, or on timeout."""
+    while True:
+        time.sleep(0.5)
+        if all(is_final(row) for row in worksheet.snapshot()):
+            result["finished"] = time.monotonic()
+            break
+        if time.monotonic() - started > timeout:
+            result["timed_out"] = True
+            break
+    _thread.interrupt_main()
+
+
+def check_accuracy(rows: list, sheet_rows: list) -> dict:
+    """Compares the written results with what the portal reported for each member."""
+    counts = {"correct": 0, "wrong": 0, "expected_errors": 0, "unexpected_errors": 0, "cached": 0}
+    for source, row in zip(rows, sheet_rows):
+        status = row[6].strip()
+        if status.endswith("(cached)"):
+            counts["cached"] += 1
+            status = status[:-len("(cached)")].strip()
+        if source[5].startswith(ERROR_PREFIX):
+            counts["expected_errors" if status.startswith("Error") else "wrong"] += 1
+            continue
+        if status.startswith(("Error", "AI Error")):
+            counts["unexpected_errors"] += 1
+            continue
+        expected = expected_result(source[5])
+        actual = {"status": status, "policy_begin": row[7].strip(), "policy_end": row[8].strip()}
+        counts["correct" if actual == expected else "wrong"] += 1
+    return counts
+
+
+def row_quantiles(jsonl_path: str) -> dict:
+    if not os.path.exists(jsonl_path):
+        return {}
+    with open(jsonl_path, encoding="utf-8") as f:
+        totals = sorted(json.loads(line)["total_seconds"] for line in f if line.strip())
+    if not totals:
+        return {}
+    pick = lambda q: totals[min(len(totals) - 1, int(round(q * (len(totals) - 1))))]
+    return {"rows": len(totals), "p50": pick(0.5), "p95": pick(0.95)}
+
+
+def print_summary(summary: dict):
+    print("\n=== Eligibility Bot Benchmark ===")
+    print(f"Rows: {summary['rows_done']}/{summary['rows']} in {summary['elapsed_seconds']:.1f}s "
+          f"-> {summary['rows_per_minute']:.1f} rows/min ({summary['workers']} worker(s))")
+    if summary["timed_out"]:
+        print("!!! Timed out before every row was finished.")
+    row_times = summary["row_seconds"]
+    if row_times:
+        print(f"Row latency: p50 {row_times['p50']:.2f}s, p95 {row_times['p95']:.2f}s")
+    print(f"Accuracy: {summary['accuracy']}")
+    print(f"{'stage':<24}{'count':>8}{'p50 s':>10}{'p95 s':>10}{'mean s':>10}")
+    for name, stage in sorted(summary["stages"].items()):
+        print(f"{name:<24}{stage['count']:>8}{stage['p50']:>10.3f}{stage['p95']:>10.3f}{stage['mean']:>10.3f}")
+    print(f"Sheets calls: {summary['sheets_calls']}")
+    print(f"Drive calls: {summary['drive_calls']}, Gemini calls: {summary['gemini_calls']}")
+    print(f"Portal requests: {summary['portal_requests']}")
+    print(f"Work directory: {summary['work_dir']}")
+
+
+def main():
+    args = parse_args()
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="eligibility-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+
+    source_rows = make_sheet_rows(args.rows, seed=args.seed, duplicate_rate=args.duplicate_rate,
+                                  error_rate=args.error_rate, irregular_rate=args.irregular_rate)
+    worksheet = FakeWorksheet(source_rows, latency=args.sheets_latency)
+    drive = FakeDrive(latency=args.drive_latency, worksheet=worksheet)
+    genai = FakeGenAI(latency=args.gemini_latency)
+    portal = PortalServer(page_latency=args.page_latency, inquiry_latency=args.inquiry_latency).start()
+    configure_bot(args, work_dir, worksheet, drive, genai, portal)
+
+    print(f"-> Benchmarking {args.rows} rows against {portal.base_url} (work dir: {work_dir})...")
+    started = time.monotonic()
+    watch = {"finished": None, "timed_out": False}
+    threading.Thread(target=watch_sheet, args=(worksheet, started, args.timeout, watch), daemon=True).start()
+
+    log_path = os.path.join(work_dir, "bot.log")
+    with open(log_path, "w", encoding="utf-8") as log, \
+            (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(log)):
+        try:
+            bot.main()
+        except KeyboardInterrupt:
+            # The interrupt landed before main() reached its worker loop.
+            pass
+    portal.stop()
+
+    finished = watch["finished"] or time.monotonic()
+    elapsed = finished - started
+    sheet_rows = worksheet.snapshot()
+    rows_done = sum(1 for row in sheet_rows if is_final(row))
+    quantiles = timing.quantiles()
+    stages = {
+        name: {"count": count, "mean": total / count if count else 0.0,
+               "p50": quantiles.get(name, (0.0, 0.0))[0], "p95": quantiles.get(name, (0.0, 0.0))[1]}
+        for name, (count, total) in timing.totals().items()
+    }
+    gemini_stats = dict(genai.stats)
+    summary = {
+        "rows": args.rows,
+        "rows_done": rows_done,
+        "workers": bot.NUM_WORKERS,
+        "overrides": args.set,
+        "elapsed_seconds": round(elapsed, 2),
+        "rows_per_minute": round(rows_done / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "timed_out": watch["timed_out"],
+        "row_seconds": row_quantiles(bot.METRICS_JSONL_FILE),
+        "accuracy": check_accuracy(source_rows, sheet_rows),
+        "stages": stages,
+        "sheets_calls": dict(worksheet.calls),
+        "drive_calls": drive.calls,
+        "gemini_calls": sum(v for k, v in gemini_stats.items() if k != "prompt_bytes"),
+        "gemini_breakdown": gemini_stats,
+        "portal_requests": dict(portal.counts),
+        "latencies": {"gemini": args.gemini_latency, "sheets": args.sheets_latency, "drive": args.drive_latency,
+                      "page": args.page_latency, "inquiry": args.inquiry_latency},
+        "work_dir": work_dir,
+    }
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"-> Summary written to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,41 @@
 import os
 import time
 import json
+import hashlib
+import threading
+import timing
 from playwright.sync_api import sync_playwright, Page, TimeoutError
 import gspread
 from google.oauth2.service_account import Credentials
-import google.generativeai as genai
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
+from caches import PayerCache, FormPlanCache, ResultCache
+from payer_index import PayerIndex
+from report_extractor import extract_report, ExtractionStats
+from row_claims import RowClaimer
+from scheduler import PayerScheduler, payer_key
+from sheet_gateway import SheetGateway, AdaptivePollInterval, drive_version_probe
+from work_journal import WorkJournal
+from screenshot_uploader import ScreenshotUploader, prune_screenshot_dir
+from gemini_client import GeminiClient
+from html_prune import prune_html, compact_form_html, compact_report_html, log_reduction, estimate_tokens, DEFAULT_KEEP_ATTRS
 
 # --- CONFIGURATION ---
 
 # IMPORTANT: PASTE YOUR GEMINI API KEY HERE
 GEMINI_API_KEY = "Gemini API Key"
+GEMINI_MODEL_NAME = 'gemini-2.0-flash-lite'
+GEMINI_REQUESTS_PER_MINUTE = 30 # Shared across all workers; match your Gemini quota tier
+GEMINI_TOKENS_PER_MINUTE = 1000000
+GEMINI_MAX_CONCURRENCY = 4 # Max Gemini calls in flight at once
+GEMINI_TIMEOUT_SECONDS = 60
+GEMINI_MAX_RETRIES = 4 # Retries on 429/5xx/timeouts, with exponential backoff and jitter
 
 # Trizetto Credentials
 TRIZETTO_USERNAME = "username"
 TRIZETTO_PASSWORD = "password"
 OTP_EMAIL_ADDRESS_TEXT = "email@email.com" # IMPORTANT: Update with the real email text
+PORTAL_BASE_URL = "https://mytools.gatewayedi.com" # The benchmark points this at its local stand-in portal
 
 # Google Services Configuration
 SCOPES = [
@@ -29,22 +48,81 @@ SCOPES = [
 SPREADSHEET_ID = 'spreadsheet ID'
 SHEET_NAME = 'Sheet1'
 DRIVE_FOLDER_ID = 'folder ID' 
-CHECK_INTERVAL_SECONDS = 60
+CHECK_INTERVAL_SECONDS = 60 # Longest idle wait between checks for new rows
+SHEET_CHANGE_DETECTION = True # Check the spreadsheet's Drive version first and only download rows when it changed
+POLL_MIN_INTERVAL_SECONDS = 5 # Idle wait right after activity; grows towards CHECK_INTERVAL_SECONDS while idle
+POLL_BACKOFF_FACTOR = 1.5
+NUM_WORKERS = 3 # Parallel browser workers, each with its own context from login_state.json
+CLAIM_VERIFY_DELAY_SECONDS = 1.0 # Wait before reading a row claim back, to detect bots on other machines
+FAST_NAVIGATION = True # Wait on real DOM conditions instead of slow_mo and fixed sleeps
+LEGACY_SLOW_MO_MS = 50 # Only used when FAST_NAVIGATION is False
+BLOCK_RESOURCE_TYPES = {"image", "font", "media"} # Never needed by the bot (set() to load everything)
+BLOCK_URL_KEYWORDS = ("google-analytics", "googletagmanager", "doubleclick", "hotjar", "newrelic", "nr-data", "clarity.ms", "facebook")
+SCHEDULER_MAX_PAYER_STREAK = 10 # A worker switches payer after this many consecutive rows of one payer
+SCHEDULER_MAX_ROW_WAIT_SECONDS = 600 # Rows pending longer than this are taken first regardless of payer
+SHEET_WRITE_BATCH_SIZE = 20 # Max rows of G:J results per Sheets write; the writer batches whatever finished since its last pass
+WRITEBACK_INTERVAL_SECONDS = 2 # How often the write-back thread copies finished results to the sheet
+INGEST_PREFETCH_ROWS = NUM_WORKERS * 2 # Rows claimed on the sheet and queued ahead of the browser workers
+SHEET_FULL_RESCAN_EVERY = 20 # Re-read from row 2 every N scans to catch rows that were reset by hand
 
 # --- File/Path Configuration ---
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 SERVICE_ACCOUNT_FILE = os.path.join(SCRIPT_DIR, 'credentials.json')
 STATE_FILE = os.path.join(SCRIPT_DIR, "login_state.json")
 SCREENSHOT_DIR = os.path.join(SCRIPT_DIR, "Screenshots")
+SCREENSHOT_BACKGROUND_UPLOADS = True # Upload screenshots on background threads instead of blocking the browser
+SCREENSHOT_UPLOAD_THREADS = 2
+SCREENSHOT_MAX_IN_FLIGHT = 8 # Workers block on new screenshots while this many uploads are pending
+SCREENSHOT_FORMAT = "png" # "png" (lossless) or "jpeg" (smaller, lossy)
+SCREENSHOT_JPEG_QUALITY = 70
+SCREENSHOT_KEEP_LOCAL = True # Also keep a copy of background uploads in SCREENSHOT_DIR
+SCREENSHOT_RETENTION_MAX_FILES = 500 # Oldest local screenshots beyond this are deleted
+SCREENSHOT_RETENTION_MAX_AGE_DAYS = 14
+PAYER_CACHE_FILE = os.path.join(SCRIPT_DIR, "payer_cache.json")
+PAYER_CACHE_MAX_FAILURES = 3 # Evict a cached payer after this many consecutive failures
+FORM_PLAN_CACHE_FILE = os.path.join(SCRIPT_DIR, "form_plan_cache.json")
+CLAIM_LOCK_FILE = os.path.join(SCRIPT_DIR, "row_claims.lock")
+RESULT_CACHE_FILE = os.path.join(SCRIPT_DIR, "result_cache.json")
+RESULT_CACHE_TTL_HOURS = 24 # Duplicate member/payer/DOS rows within this window are answered from cache (0 disables)
+RESULT_CACHE_MAX_ENTRIES = 5000
+WORK_JOURNAL_FILE = os.path.join(SCRIPT_DIR, "work_journal.sqlite3") # Claimed/in-flight/finished rows, for crash recovery
+JOURNAL_LEASE_SECONDS = 300 # A leased row whose worker stops heartbeating is handed out again after this long
+JOURNAL_HEARTBEAT_SECONDS = 60
+JOURNAL_MAX_ATTEMPTS = 3 # Rows leased this many times without finishing (e.g. the bot crashed each time) are written back as errors
+JOURNAL_RETENTION_HOURS = 24 # Written rows are kept in the journal this long
+METRICS_JSONL_FILE = os.path.join(SCRIPT_DIR, "metrics", "rows.jsonl") # One JSON record per row with its stage breakdown
+METRICS_PROM_FILE = os.path.join(SCRIPT_DIR, "metrics", "eligibility_bot.prom") # Prometheus text format (None to disable)
+METRICS_WINDOW = 200 # Recent samples per stage used for the rolling p50/p95
+REPORT_RULES_MIN_CONFIDENCE = 0.8 # Below this, the rule-based report extraction escalates to Gemini
 
 # --- AI AND AUTOMATION LOGIC ---
 
-def upload_screenshot_to_drive(drive_service, folder_id, file_path):
+_gemini_client = None
+_gemini_client_lock = threading.Lock()
+
+def get_gemini_client() -> GeminiClient:
+    """Returns the process-wide Gemini client shared by every AI helper and worker."""
+    global _gemini_client
+    with _gemini_client_lock:
+        if _gemini_client is None:
+            _gemini_client = GeminiClient(
+                GEMINI_API_KEY, GEMINI_MODEL_NAME,
+                requests_per_minute=GEMINI_REQUESTS_PER_MINUTE, tokens_per_minute=GEMINI_TOKENS_PER_MINUTE,
+                max_concurrency=GEMINI_MAX_CONCURRENCY, timeout=GEMINI_TIMEOUT_SECONDS, max_retries=GEMINI_MAX_RETRIES,
+            )
+        return _gemini_client
+
+def prompt_size(prompt: str) -> dict:
+    """Span attributes describing the size of a Gemini prompt."""
+    return {"prompt_bytes": len(prompt.encode("utf-8")), "prompt_tokens": estimate_tokens(prompt)}
+
+@timing.traced("drive_upload")
+def upload_screenshot_to_drive(drive_service, folder_id, file_path, mimetype='image/png'):
     """Uploads a file to Google Drive and returns its shareable link."""
     try:
         print(f"   - Uploading '{os.path.basename(file_path)}' to Google Drive...")
         file_metadata = {'name': os.path.basename(file_path), 'parents': [folder_id]}
-        media = MediaFileUpload(file_path, mimetype='image/png', resumable=True)
+        media = MediaFileUpload(file_path, mimetype=mimetype, resumable=True)
         file = drive_service.files().create(
             body=file_metadata,
             media_body=media,
@@ -61,8 +139,8 @@ def upload_screenshot_to_drive(drive_service, folder_id, file_path):
 def generate_form_fill_plan(page_html: str, patient_data: dict) -> list:
     """Uses Gemini to generate a plan to fill the web form."""
     print("   - Asking AI to generate a form-filling plan...")
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-2.0-flash-lite')
+    form_html = compact_form_html(page_html) or prune_html(page_html)
+    log_reduction("form", page_html, form_html)
     prompt = f"""
     You are a meticulous web automation assistant. Your task is to analyze the provided HTML of a web form and a JSON object of patient data. Create a JSON array of steps to fill ALL necessary fields based on the patient data provided.
 
@@ -80,159 +158,670 @@ def generate_form_fill_plan(page_html: str, patient_data: dict) -> list:
 
     **Form HTML:**
     ```html
-    {page_html}
+    {form_html}
     ```
     """
     try:
-        response = model.generate_content(prompt)
-        cleaned_text = response.text.strip().replace("```json", "").replace("```", "").strip()
-        plan = json.loads(cleaned_text)
+        with timing.span("ai_form_plan", **prompt_size(prompt)):
+            plan = get_gemini_client().generate_json(prompt, expect=list, required_keys=("selector", "value"))
         print("   - AI form-fill plan generated successfully.")
         return plan
     except Exception as e:
         print(f"   -!- CRITICAL: AI failed to generate a valid form-fill plan: {e}")
-        raw_text = "unavailable"
-        if 'response' in locals() and hasattr(response, 'text'):
-            raw_text = response.text
-        print(f"   -!- Raw AI response was: {raw_text}")
+        print(f"   -!- Raw AI response was: {getattr(e, 'raw_text', None) or 'unavailable'}")
         return []
 
 def parse_report_with_ai(html_content: str) -> dict:
     """Uses the Gemini AI to parse the HTML of an eligibility report."""
     print("   - Asking AI to parse the report with enhanced logic...")
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-2.0-flash-lite')
+    report_text = compact_report_html(html_content) or prune_html(html_content)
+    log_reduction("report", html_content, report_text)
     prompt = f"""
-    You are an expert data extraction bot. Analyze the HTML of an insurance report.
+    You are an expert data extraction bot. Analyze the text of an insurance report (tables are rendered as "cell | cell" rows and definition lists as "Term: Value" lines).
     Find "Eligibility Status", "Plan Begin Date", and "Plan End Date".
     CRITICAL: The report may have multiple "Plan Begin" dates for sub-benefits (like Vision, Dental). You MUST identify the date associated with the main "Health Benefit Plan Coverage" or the primary policy.
     If a date is a range like "1/1/2025 - 12/31/2025", extract both.
     If not found, return "Not Found".
     Return ONLY a valid JSON object with keys: "status", "policy_begin", "policy_end".
-    HTML:
-    ```html
-    {html_content}
+    Report:
+    ```text
+    {report_text}
     ```
     """
     try:
-        response = model.generate_content(prompt)
-        cleaned_response_text = response.text.strip().replace("```json", "").replace("```", "").strip()
-        result_json = json.loads(cleaned_response_text)
+        with timing.span("ai_report_parse", **prompt_size(prompt)):
+            result_json = get_gemini_client().generate_json(prompt, expect=dict, required_keys=("status", "policy_begin", "policy_end"))
         print("   - AI successfully parsed data.")
         return result_json
     except Exception as e:
-        raw_text = "unavailable"
-        if 'response' in locals() and hasattr(response, 'text'):
-            raw_text = response.text
-        print(f"   -!- AI parsing failed: {e}. Raw response: {raw_text}")
+        print(f"   -!- AI parsing failed: {e}. Raw response: {getattr(e, 'raw_text', None) or 'unavailable'}")
         return {"status": "AI Error", "policy_begin": "AI Error", "policy_end": str(e)}
 
-def select_payer_with_ai(page: Page, payer_name: str):
-    """Uses Gemini AI to find and select the correct payer from a complex list."""
-    print("   - Starting AI-powered payer selection...")
-    page.goto("https://mytools.gatewayedi.com/ManagePatients/RealTimeEligibility/Index", wait_until="domcontentloaded")
-    
-    payer_list_container = page.locator("#InsurerAccordion")
-    payer_list_container.wait_for(state="visible", timeout=30000)
-    list_html = payer_list_container.inner_html()
-    
+def parse_report(html_content: str, extraction_stats: ExtractionStats = None) -> dict:
+    """Parses the report with the rule-based extractor and escalates to Gemini AI only when confidence is low."""
+    start = time.monotonic()
+    report_data, confidence = extract_report(html_content)
+    if confidence >= REPORT_RULES_MIN_CONFIDENCE:
+        print(f"   - Report parsed by rules (confidence {confidence:.2f}).")
+        if extraction_stats is not None:
+            extraction_stats.record("rules", time.monotonic() - start)
+        return report_data
+
+    print(f"   - Rule-based extraction confidence {confidence:.2f} is too low. Escalating to AI...")
+    report_data = parse_report_with_ai(html_content)
+    if extraction_stats is not None:
+        extraction_stats.record("ai", time.monotonic() - start)
+    return report_data
+
+def payer_link_exists(page: Page, category_text: str, payer_text: str) -> bool:
+    """Cheaply checks that a category/payer link pair is still present in the accordion."""
+    try:
+        if page.get_by_text(category_text, exact=True).count() == 0:
+            return False
+        payer_list_container = page.locator(f"li[id='{category_text}'] ul.insurersDetail")
+        return payer_list_container.get_by_text(payer_text, exact=True).count() > 0
+    except Exception:
+        return False
+
+FORM_READY_JS = """
+() => {
+    const button = document.querySelector('#btnUploadButton');
+    const visible = el => el && el.offsetParent !== null;
+    return visible(button) && Array.from(document.querySelectorAll('input[type="text"], input:not([type])')).some(visible);
+}
+"""
+
+def click_payer(page: Page, category_text: str, payer_text: str):
+    """Clicks through the accordion to the given category and payer links and waits for the payer's form."""
+    print("   - Clicking category...")
+    # FIX: Use get_by_text which is robust for elements without hrefs.
+    category_element = page.get_by_text(category_text, exact=True).first
+    # FIX: Find the correct container for the payer links after the category is clicked.
+    payer_list_container = page.locator(f"li[id='{category_text}'] ul.insurersDetail")
+    with timing.span("payer_category"):
+        category_element.click()
+        if FAST_NAVIGATION:
+            payer_list_container.wait_for(state="visible", timeout=15000)
+        else:
+            page.wait_for_timeout(1000)
+
+    print("   - Clicking final payer...")
+    payer_link = payer_list_container.get_by_text(payer_text, exact=True).first
+    with timing.span("payer_form_load"):
+        payer_link.click()
+        if FAST_NAVIGATION:
+            page.wait_for_function(FORM_READY_JS, timeout=30000)
+        else:
+            page.wait_for_timeout(2000)
+
+def choose_payer_with_ai(payer_name: str, candidates: list = None, list_html: str = None) -> dict:
+    """Asks Gemini to pick the payer, from a short candidate list when available or the full list HTML otherwise."""
     print("   - Asking AI to find the best payer match and create a plan...")
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-2.0-flash-lite')
-    
-    prompt = f"""
+
+    if candidates:
+        candidate_list = [{"category_text": c["category_text"], "payer_text": c["payer_text"]} for c in candidates]
+        prompt = f"""
+    You are an expert insurance payer matching assistant. The user wants to select the payer: **"{payer_name}"**.
+    Choose the single best and most logical match from the candidate list below. For example, "UMR" matches "UMR-Wausau" and "BCBS North Carolina" matches the "BCBS North Carolina" link in the "Blue Cross Blue Shield" category.
+    Return ONLY a JSON object with two keys, copied exactly from the chosen candidate: "category_text" and "payer_text".
+    **Candidates:**
+    ```json
+    {json.dumps(candidate_list, indent=2)}
+    ```
+    """
+    else:
+        pruned_html = prune_html(list_html, keep_attrs=DEFAULT_KEEP_ATTRS | {"class"}, drop_hidden=False)
+        log_reduction("payer list", list_html, pruned_html)
+        prompt = f"""
     You are an expert web automation assistant. Analyze the provided HTML of a payer list and a target payer name. Generate a two-step JSON plan to select the correct payer.
     1.  The user wants to select: **"{payer_name}"**.
     2.  Find the Best Match: Determine which category the target payer belongs to. Then, find the best and most logical match for the target name within that category's list. For example, if the target is "UMR", match it to "UMR-Wausau". If the target is "BCBS North Carolina", find the "Blue Cross Blue Shield" category and then the "BCBS North Carolina" link.
     3.  Return ONLY a JSON object with two keys: "category_text" (the exact text of the category link) and "payer_text" (the exact text of the final payer link).
     **Payer List HTML:**
     ```html
-    {list_html}
+    {pruned_html}
     ```
     """
-    
+
+    with timing.span("ai_payer_select", **prompt_size(prompt)):
+        plan = get_gemini_client().generate_json(prompt, expect=dict, required_keys=("category_text", "payer_text"))
+    if candidates and not any(
+        c["category_text"] == plan.get("category_text") and c["payer_text"] == plan.get("payer_text") for c in candidates
+    ):
+        raise ValueError(f"AI chose a payer outside the candidate list: {plan}")
+    print(f"   - AI Plan Received. Category: '{plan['category_text']}', Payer: '{plan['payer_text']}'")
+    return plan
+
+@timing.traced("select_payer")
+def select_payer_with_ai(page: Page, payer_name: str, payer_cache: PayerCache = None, payer_index: PayerIndex = None):
+    """Selects the correct payer using the payer cache, then the local payer index, and asks Gemini AI only when ambiguous."""
+    print("   - Starting AI-powered payer selection...")
+    payer_list_container = page.locator("#InsurerAccordion")
+    with timing.span("eligibility_page_load"):
+        page.goto(f"{PORTAL_BASE_URL}/ManagePatients/RealTimeEligibility/Index", wait_until="domcontentloaded")
+        payer_list_container.wait_for(state="visible", timeout=30000)
+
+    if payer_cache is not None:
+        cached = payer_cache.lookup(payer_name)
+        if cached and payer_link_exists(page, cached['category_text'], cached['payer_text']):
+            print(f"   - Payer cache hit. Category: '{cached['category_text']}', Payer: '{cached['payer_text']}'")
+            try:
+                click_payer(page, cached['category_text'], cached['payer_text'])
+                payer_cache.confirm(payer_name)
+                print(f"   - Cached Payer Selection for '{payer_name}' successful.")
+                return
+            except Exception as e:
+                print(f"   -!- Cached payer selection failed: {e}. Falling back to AI...")
+                payer_cache.record_failure(payer_name)
+                page.goto(f"{PORTAL_BASE_URL}/ManagePatients/RealTimeEligibility/Index", wait_until="domcontentloaded")
+                payer_list_container.wait_for(state="visible", timeout=30000)
+        elif cached:
+            print("   - Cached payer link no longer in the list. Falling back to AI...")
+            if payer_cache.record_failure(payer_name):
+                print(f"   - Evicted stale cache entry for '{payer_name}'.")
+
+    if payer_index is not None and payer_index.is_empty():
+        payer_index.build_from_html(payer_list_container.inner_html())
+        print(f"   - Indexed {len(payer_index.entries)} payers across {len(payer_index.categories)} categories.")
+
+    plan, candidates = None, []
+    if payer_index is not None and not payer_index.is_empty():
+        plan, candidates = payer_index.resolve(payer_name)
+        if plan:
+            print(f"   - Local match found (score {plan['score']:.2f}). Category: '{plan['category_text']}', Payer: '{plan['payer_text']}'")
+
     try:
-        response = model.generate_content(prompt)
-        cleaned_text = response.text.strip().replace("```json", "").replace("```", "").strip()
-        plan = json.loads(cleaned_text)
-
-        print(f"   - AI Plan Received. Category: '{plan['category_text']}', Payer: '{plan['payer_text']}'")
-        
-        print("   - Clicking category...")
-        # FIX: Use get_by_text which is robust for elements without hrefs.
-        category_element = page.get_by_text(plan['category_text'], exact=True).first
-        category_element.click()
-        page.wait_for_timeout(1000)
-        
-        print("   - Clicking final payer...")
-        # FIX: Find the correct container for the payer links after the category is clicked.
-        payer_list_container = page.locator(f"li[id='{plan['category_text']}'] ul.insurersDetail")
-        payer_link = payer_list_container.get_by_text(plan['payer_text'], exact=True).first
-        payer_link.click()
-        
-        page.wait_for_timeout(2000)
-        print(f"   - AI Payer Selection for '{payer_name}' successful.")
+        if plan is None:
+            if candidates:
+                plan = choose_payer_with_ai(payer_name, candidates=candidates)
+            else:
+                plan = choose_payer_with_ai(payer_name, list_html=payer_list_container.inner_html())
+
+        click_payer(page, plan['category_text'], plan['payer_text'])
+        if payer_cache is not None:
+            payer_cache.put(payer_name, plan['category_text'], plan['payer_text'])
+        print(f"   - Payer Selection for '{payer_name}' successful.")
 
     except Exception as e:
-        print(f"   -!- CRITICAL: AI-driven payer selection failed: {e}")
+        print(f"   -!- CRITICAL: Payer selection failed: {e}")
+        if payer_index is not None:
+            # The accordion may have changed; rebuild the index on the next row.
+            payer_index.clear()
         raise e
 
-def process_patient(page: Page, drive_service, patient_data: dict) -> dict:
-    """Handles the AI-driven form filling, result parsing, and screenshot upload for a patient."""
-    screenshot_link = "N/A"
+RESPONSE_READY_JS = """
+() => ['#eligibilityRequestResponse', '#EligibilityValidationErrors'].some(selector => {
+    const el = document.querySelector(selector);
+    return el && el.offsetParent !== null && el.innerText.trim().length > 0;
+})
+"""
+
+RESET_FORM_JS = """
+() => {
+    if (!document.querySelector('#btnUploadButton')) return false;
+    for (const selector of ['#eligibilityRequestResponse', '#EligibilityValidationErrors']) {
+        const el = document.querySelector(selector);
+        if (el) el.innerHTML = '';
+    }
+    document.querySelectorAll('input[type="text"], input:not([type])').forEach(input => { input.value = ''; });
+    return true;
+}
+"""
+
+def reset_form_in_place(page: Page) -> bool:
+    """Clears the already-loaded payer form and the previous report so the next patient can reuse it."""
     try:
-        form_html = page.locator("body").inner_html()
-        
-        fill_plan = generate_form_fill_plan(form_html, patient_data)
-        if not fill_plan:
-            raise ValueError("AI did not return a valid form-filling plan.")
+        return bool(page.evaluate(RESET_FORM_JS))
+    except Exception as e:
+        print(f"   -!- Could not reset the form in place: {e}")
+        return False
 
-        print("   - Executing AI form-filling plan...")
+def take_screenshot(target, kind: str, patient_data: dict, drive_service, uploader: ScreenshotUploader = None) -> dict:
+    """
+    Screenshots a page or locator. Without an uploader it is saved and uploaded synchronously;
+    with one, the bytes are returned for the background upload queue.
+    """
+    extension = "jpg" if SCREENSHOT_FORMAT == "jpeg" else "png"
+    mimetype = "image/jpeg" if SCREENSHOT_FORMAT == "jpeg" else "image/png"
+    file_name = f"{kind}_{patient_data['last_name']}_{patient_data['first_name']}.{extension}"
+    options = {"type": SCREENSHOT_FORMAT, "scale": "css"}
+    if SCREENSHOT_FORMAT == "jpeg":
+        options["quality"] = SCREENSHOT_JPEG_QUALITY
+    try:
+        if uploader is None:
+            os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+            screenshot_path = os.path.join(SCREENSHOT_DIR, file_name)
+            target.screenshot(path=screenshot_path, **options)
+            return {"screenshot_link": upload_screenshot_to_drive(drive_service, DRIVE_FOLDER_ID, screenshot_path, mimetype)}
+        data = target.screenshot(**options)
+        return {"screenshot_link": "Uploading...", "pending_screenshot": (file_name, data, mimetype)}
+    except Exception as e:
+        print(f"   -!- Screenshot failed: {e}")
+        return {"screenshot_link": "Screenshot Failed"}
+
+FORM_FINGERPRINT_JS = """
+() => Array.from(document.querySelectorAll('input, select, textarea'))
+    .filter(el => !['hidden', 'submit', 'button', 'image', 'reset'].includes((el.type || '').toLowerCase()))
+    .map(el => {
+        const label = (el.id && document.querySelector(`label[for="${CSS.escape(el.id)}"]`)) || el.closest('label');
+        return [
+            el.tagName.toLowerCase(), (el.type || '').toLowerCase(), el.id || '', el.name || '',
+            label ? label.textContent.replace(/\\s+/g, ' ').trim() : ''
+        ];
+    })
+"""
+
+def form_fingerprint(page: Page) -> str:
+    """Hashes the structure (tags, types, ids, names, labels) of the form's inputs, ignoring their values."""
+    fields = page.evaluate(FORM_FINGERPRINT_JS)
+    return hashlib.sha1(json.dumps(sorted(fields)).encode("utf-8")).hexdigest()
+
+def plan_to_field_map(fill_plan: list, patient_data: dict):
+    """Turns an AI selector -> value plan into a reusable selector -> patient field mapping, or None if ambiguous."""
+    fields = []
+    for step in fill_plan:
+        matches = [key for key, value in patient_data.items() if str(value) == str(step['value'])]
+        if len(matches) != 1:
+            return None
+        fields.append({"selector": step['selector'], "field": matches[0]})
+    return fields
+
+def ai_form_fill_plan(page: Page, patient_data: dict) -> list:
+    """Asks Gemini for a form-fill plan for the form currently on the page; raises if none comes back."""
+    fill_plan = generate_form_fill_plan(page.locator("body").inner_html(), patient_data)
+    if not fill_plan:
+        raise ValueError("AI did not return a valid form-filling plan.")
+    return fill_plan
+
+def fill_form(page: Page, fill_plan: list):
+    with timing.span("form_fill"):
         for step in fill_plan:
             print(f"     - Filling selector '{step['selector']}' with value '{step['value']}'")
             page.locator(step['selector']).fill(step['value'])
-        print("   - Form filled according to AI plan.")
 
-        page.locator("#btnUploadButton").click()
-        
+@timing.traced("process_patient")
+def process_patient(page: Page, drive_service, patient_data: dict, form_plan_cache: FormPlanCache = None,
+                    extraction_stats: ExtractionStats = None, uploader: ScreenshotUploader = None) -> dict:
+    """
+    Handles the AI-driven form filling, result parsing, and screenshot upload for a patient.
+    With an uploader, the screenshot is returned as 'pending_screenshot' bytes for a background upload.
+    """
+    payer_name = patient_data['payer_name']
+    try:
+        fingerprint, fill_plan, plan_from_cache = None, None, False
+        if form_plan_cache is not None:
+            fingerprint = form_fingerprint(page)
+            cached_fields = form_plan_cache.lookup(payer_name, fingerprint)
+            if cached_fields:
+                print("   - Using cached form-fill plan (no AI call needed).")
+                fill_plan = [{"selector": f['selector'], "value": patient_data[f['field']]} for f in cached_fields]
+                plan_from_cache = True
+
+        if not fill_plan:
+            fill_plan = ai_form_fill_plan(page, patient_data)
+
+        print("   - Executing form-filling plan...")
+        try:
+            fill_form(page, fill_plan)
+        except Exception as e:
+            if not plan_from_cache:
+                raise
+            # The payer's form changed under a cached plan: drop it and let the AI plan this row afresh.
+            print(f"   -!- Cached form-fill plan no longer fits the form ({e}). Asking AI for a new plan...")
+            form_plan_cache.invalidate(payer_name)
+            fill_plan, plan_from_cache = ai_form_fill_plan(page, patient_data), False
+            fill_form(page, fill_plan)
+        print("   - Form filled according to plan.")
+
         print("   - Waiting for response (success or error)...")
-        page.wait_for_selector(
-            "#eligibilityRequestResponse, #EligibilityValidationErrors",
-            timeout=45000
-        )
+        with timing.span("report_wait"):
+            page.locator("#btnUploadButton").click()
+            # Wait for non-empty content rather than mere presence, so a reused form never matches the previous report.
+            page.wait_for_function(RESPONSE_READY_JS, timeout=45000)
 
         error_div = page.locator("#EligibilityValidationErrors")
         if error_div.is_visible() and len(error_div.inner_text().strip()) > 0:
             raise ValueError(f"Form submission error on page: {error_div.inner_text().strip()}")
 
+        if form_plan_cache is not None and not plan_from_cache:
+            field_map = plan_to_field_map(fill_plan, patient_data)
+            if field_map:
+                form_plan_cache.put(payer_name, fingerprint, field_map)
+                print("   - Form-fill plan cached for this payer's form.")
+
         report_container = page.locator("#eligibilityRequestResponse")
         report_html = report_container.inner_html()
-        report_data = parse_report_with_ai(report_html)
+        with timing.span("report_parse"):
+            report_data = parse_report(report_html, extraction_stats)
 
-        os.makedirs(SCREENSHOT_DIR, exist_ok=True)
-        screenshot_path = os.path.join(SCREENSHOT_DIR, f"SUCCESS_{patient_data['last_name']}_{patient_data['first_name']}.png")
-        report_container.screenshot(path=screenshot_path)
-        
-        screenshot_link = upload_screenshot_to_drive(drive_service, DRIVE_FOLDER_ID, screenshot_path)
-        report_data['screenshot_link'] = screenshot_link
+        with timing.span("screenshot"):
+            report_data.update(take_screenshot(report_container, "SUCCESS", patient_data, drive_service, uploader))
 
         print(f"-> Check complete for {patient_data['first_name']}. Status: {report_data.get('status')}")
         return report_data
 
     except Exception as e:
         print(f"   -!- An error occurred during patient processing: {e}")
-        os.makedirs(SCREENSHOT_DIR, exist_ok=True)
-        screenshot_path = os.path.join(SCREENSHOT_DIR, f"ERROR_{patient_data['last_name']}_{patient_data['first_name']}.png")
-        page.screenshot(path=screenshot_path)
-        
-        screenshot_link = upload_screenshot_to_drive(drive_service, DRIVE_FOLDER_ID, screenshot_path)
-        
-        return {"status": f"Error: {type(e).__name__}", "policy_begin": f"{e}", "policy_end": "", "screenshot_link": screenshot_link}
+        error_data = {"status": f"Error: {type(e).__name__}", "policy_begin": f"{e}", "policy_end": ""}
+        error_data.update(take_screenshot(page, "ERROR", patient_data, drive_service, uploader))
+        return error_data
+
+# --- SESSION AND WORKERS ---
+
+LOGIN_LOCK = threading.Lock()
+BROWSER_SLOW_MO = 0 if FAST_NAVIGATION else LEGACY_SLOW_MO_MS
+
+def block_unneeded_resources(context):
+    """Aborts requests for images, fonts, media and analytics, which the bot never needs."""
+    if not BLOCK_RESOURCE_TYPES and not BLOCK_URL_KEYWORDS:
+        return
+
+    def handle(route):
+        request = route.request
+        if request.resource_type in BLOCK_RESOURCE_TYPES or any(keyword in request.url for keyword in BLOCK_URL_KEYWORDS):
+            route.abort()
+        else:
+            route.continue_()
+
+    context.route("**/*", handle)
+
+def session_is_valid(page: Page) -> bool:
+    """Checks that the page is still logged in to Trizetto."""
+    try:
+        page.goto(f"{PORTAL_BASE_URL}/default.aspx", timeout=60000)
+        page.locator("#NavCtrl_navHome").wait_for(timeout=15000)
+        return True
+    except Exception:
+        return False
+
+def log_in(browser):
+    """Performs an interactive Trizetto login (with OTP) and saves the session to STATE_FILE."""
+    print("-> Performing new login to Trizetto...")
+    context = browser.new_context()
+    block_unneeded_resources(context)
+    page = context.new_page()
+    page.goto(f"{PORTAL_BASE_URL}/LogOn")
+    page.fill('input[name="UserName"]', TRIZETTO_USERNAME)
+    page.fill('input[type="password"]', TRIZETTO_PASSWORD)
+    page.click('input[type="submit"]')
+    print("   - Handling OTP step...")
+    page.locator(f'text={OTP_EMAIL_ADDRESS_TEXT}').click()
+    otp_code = input(">>> Please check your email for the OTP and enter it here: ")
+    page.locator("#AuthCode").press_sequentially(otp_code, delay=100)
+    page.locator("#btnVerify").click()
+    page.wait_for_url("**/default.aspx**", timeout=30000)
+    print("-> LOGIN SUCCESSFUL! Saving session...")
+    context.storage_state(path=STATE_FILE)
+    return context, page
+
+def open_session(browser):
+    """
+    Opens a new browser context from the shared login_state.json, logging in again if it is
+    missing or expired. Serialized so only one worker ever prompts for an OTP.
+    """
+    with LOGIN_LOCK:
+        if os.path.exists(STATE_FILE):
+            print("-> Found saved session. Attempting to use...")
+            context = browser.new_context(storage_state=STATE_FILE)
+            block_unneeded_resources(context)
+            page = context.new_page()
+            if session_is_valid(page):
+                print("-> Session is valid. Login skipped.")
+                return context, page
+            print("-> Session invalid. A new login is required.")
+            context.close()
+        return log_in(browser)
+
+def print_run_stats(shared: dict):
+    """Prints cache hit rates and report-parsing paths accumulated across all workers."""
+    stats = shared['payer_cache'].stats()
+    print(f"-> Payer cache: {stats['hits']} hits, {stats['misses']} misses, {stats['stale']} stale, "
+          f"{stats['evictions']} evicted.")
+    stats = shared['form_plan_cache'].stats()
+    print(f"-> Form plan cache: {stats['hits']} hits, {stats['misses']} misses, "
+          f"{stats['invalidations']} invalidated (hit rate {stats['hit_rate']:.0%}).")
+    print(f"-> Report parsing paths: {shared['extraction_stats'].summary()}")
+    print(f"-> Stage latency p50/p95: {timing.format_quantiles()}")
+    gateway = shared['gateway']
+    print(f"-> Sheets: {gateway.api_calls} API calls, {gateway.scans} scans, {gateway.skipped_scans} skipped (sheet unchanged).")
+    print(f"-> Work journal: {shared['journal'].stats()}")
+    if shared['result_cache'] is not None:
+        stats = shared['result_cache'].stats()
+        print(f"-> Result cache: {stats['hits']} duplicate rows answered from cache, {stats['misses']} full checks.")
+
+def is_cacheable_result(results: dict) -> bool:
+    """
+    Only clean results with a real Drive link are memoized; errors and failed, pending or local
+    screenshots should be checked again on the next duplicate instead of copying a broken link.
+    """
+    status = str(results.get("status", ""))
+    if not status or status.startswith(("Error", "AI Error")) or status == "Not Found":
+        return False
+    return str(results.get("screenshot_link", "")).startswith("https://")
+
+def handle_row(page: Page, drive_service, journal: WorkJournal, worker_name: str, row_index: int, row: list, shared: dict,
+               payer_index: PayerIndex, reuse_form: bool = False) -> str:
+    """
+    Runs one leased row through payer selection and patient processing and records the results in the
+    work journal, from which the write-back thread writes them to the sheet.
+    With reuse_form, the payer's form already on the page is reset instead of selecting the payer again.
+    Returns "ok" when the page now holds this row's payer form after a clean report, "error" when the
+    page may be left in an error state, or "cached" when the row was answered without touching the page.
+    """
+    uploader = shared['uploader']
+    result_cache = shared['result_cache']
+    current_payer = row[4].strip()
+    patient_data = {
+        "dos": row[0], "first_name": row[1],
+        "last_name": row[2], "dob": row[3],
+        "payer_name": current_payer, "member_id": row[5]
+    }
+
+    cached = result_cache.lookup(patient_data) if result_cache is not None else None
+    if cached:
+        print(f"-> Duplicate of a recent check. Answering row {row_index} from the result cache...")
+        if not journal.write_result(row_index, [
+            f"{cached.get('status', '')} (cached)",
+            cached.get("policy_begin", ""),
+            cached.get("policy_end", ""),
+            cached.get("screenshot_link", ""),
+        ], worker_name):
+            print(f"   -!- [{worker_name}] Lost the lease on row {row_index} to another worker. Dropping this result.")
+        timing.tag_row(outcome="cached")
+        return "cached"
+
+    with timing.span("form_reset"):
+        form_reused = reuse_form and reset_form_in_place(page)
+    if form_reused:
+        print(f"   - Same payer as the previous row. Reusing the loaded form for '{current_payer}'.")
+    else:
+        select_payer_with_ai(page, current_payer, shared['payer_cache'], payer_index)
+
+    results = process_patient(page, drive_service, patient_data, shared['form_plan_cache'], shared['extraction_stats'], uploader)
+
+    outcome = "error" if str(results.get("status", "")).startswith("Error") else "ok"
+    timing.tag_row(outcome=outcome)
+    print(f"-> Writing results back to row {row_index}...")
+    if not journal.write_result(row_index, [
+        results.get("status", "Error"),
+        results.get("policy_begin", ""),
+        results.get("policy_end", ""),
+        results.get("screenshot_link", "Upload Failed"),
+    ], worker_name):
+        # The other worker records (and uploads) its own result for this row.
+        print(f"   -!- [{worker_name}] Lost the lease on row {row_index} to another worker. Dropping this result.")
+        return outcome
+    cached_result = {key: results.get(key, "") for key in ("status", "policy_begin", "policy_end", "screenshot_link")}
+    if results.get("pending_screenshot"):
+        # The link column (and the memoized result) is filled in when the background upload finishes.
+        def on_uploaded(link):
+            journal.write_link(row_index, link)
+            uploaded_result = dict(cached_result, screenshot_link=link)
+            if result_cache is not None and is_cacheable_result(uploaded_result):
+                result_cache.put(patient_data, uploaded_result)
+        file_name, data, mimetype = results["pending_screenshot"]
+        uploader.submit(file_name, data, mimetype, on_done=on_uploaded)
+    elif result_cache is not None and is_cacheable_result(cached_result):
+        result_cache.put(patient_data, cached_result)
+    return outcome
+
+def run_ingester(shared: dict, stop_event: threading.Event):
+    """
+    Sheet ingestion stage: claims pending rows on the sheet ahead of the browser workers and queues
+    them in the work journal, keeping at most INGEST_PREFETCH_ROWS waiting.
+    """
+    claimer = shared['claimer']
+    gateway = shared['gateway']
+    journal = shared['journal']
+    if SHEET_CHANGE_DETECTION:
+        poll = AdaptivePollInterval(POLL_MIN_INTERVAL_SECONDS, CHECK_INTERVAL_SECONDS, POLL_BACKOFF_FACTOR)
+    else:
+        poll = AdaptivePollInterval(CHECK_INTERVAL_SECONDS, CHECK_INTERVAL_SECONDS)
+
+    while not stop_event.is_set():
+        try:
+            room = INGEST_PREFETCH_ROWS - journal.backlog()
+            if room <= 0:
+                stop_event.wait(1)
+                continue
+            if not gateway.has_changed():
+                wait = poll.next_interval()
+                print(f"-> [ingest] Sheet unchanged. Checking again in {wait:.0f} seconds...")
+                stop_event.wait(wait)
+                continue
+
+            print(f"\n--- [ingest] Checking for new records... ({time.ctime()}) ---")
+            with timing.span("sheet_claim"):
+                loaded_payers = [payer for payer in shared['loaded_payers'].values() if payer]
+                claimed = claimer.claim_many(gateway, "ingest", room, skip=journal.active_rows(), loaded_payers=loaded_payers)
+            for row_index, row in claimed:
+                if journal.enqueue(row_index, row):
+                    print(f"-> [ingest] Queued row {row_index} for Payer: '{row[4].strip()}'")
+                else:
+                    claimer.release(row_index)
+            if claimed:
+                poll.reset()
+            else:
+                wait = poll.next_interval()
+                print(f"-> [ingest] No new records found. Waiting {wait:.0f} seconds...")
+                stop_event.wait(wait)
+
+        except gspread.exceptions.APIError as e:
+            cooldown = gateway.cooldown()
+            print(f"-!- [ingest] GOOGLE SHEETS API ERROR: {e}. Waiting {cooldown:.0f} seconds...")
+            stop_event.wait(cooldown)
+        except Exception as e:
+            print(f"-!- [ingest] AN UNEXPECTED ERROR WHILE READING THE SHEET: {e}. Waiting {CHECK_INTERVAL_SECONDS} seconds...")
+            stop_event.wait(CHECK_INTERVAL_SECONDS)
+
+def write_back(shared: dict) -> int:
+    """Writes every completed journal row to the sheet in one flush and marks them written; returns how many."""
+    journal = shared['journal']
+    gateway = shared['gateway']
+    rows = journal.completed_rows()
+    if not rows:
+        return 0
+    with timing.span("sheet_write_back", rows=len(rows)):
+        for row_index, values, _ in rows:
+            gateway.write_result(row_index, values)
+        gateway.flush()
+    for row_index, _, revision in rows:
+        journal.mark_written(row_index, revision)
+        shared['claimer'].release(row_index)
+    return len(rows)
+
+def run_writer(shared: dict, stop_event: threading.Event):
+    """Write-back stage: copies finished results (and late screenshot links) from the journal to the sheet."""
+    while not stop_event.is_set():
+        try:
+            write_back(shared)
+            stop_event.wait(WRITEBACK_INTERVAL_SECONDS)
+        except gspread.exceptions.APIError as e:
+            cooldown = shared['gateway'].cooldown()
+            print(f"-!- [writer] GOOGLE SHEETS API ERROR: {e}. Waiting {cooldown:.0f} seconds...")
+            stop_event.wait(cooldown)
+        except Exception as e:
+            print(f"-!- [writer] AN UNEXPECTED ERROR WHILE WRITING RESULTS: {e}")
+            stop_event.wait(WRITEBACK_INTERVAL_SECONDS)
+
+def run_worker(worker_name: str, creds, shared: dict, stop_event: threading.Event):
+    """
+    One browser worker: its own Drive client, Playwright instance, browser and context. Leases rows
+    from the work journal (heartbeating the lease while it works), records the results there, and
+    rebuilds its session whenever the page crashes or the login expires.
+    """
+    # googleapiclient clients are not thread-safe, so each worker builds its own.
+    drive_service = build('drive', 'v3', credentials=creds)
+    journal = shared['journal']
+    payer_index = PayerIndex()
+    loaded_payer, streak = None, 0 # Payer whose form is on the page, and how many rows in a row used it
+    idle = AdaptivePollInterval(0.5, 5) # The journal is local, so polling it is cheap
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True, slow_mo=BROWSER_SLOW_MO)
+        context, page = open_session(browser)
+
+        while not stop_event.is_set():
+            row_index = None
+            try:
+                row_index, row = journal.lease_next(worker_name, loaded_payer, streak)
+                if not row_index:
+                    stop_event.wait(idle.next_interval())
+                    continue
+
+                idle.reset()
+                print(f"\n--- [{worker_name}] Leased row {row_index} for Payer: '{row[4].strip()}' ({time.ctime()}) ---")
+                same_payer = loaded_payer is not None and payer_key(row) == loaded_payer
+                timing.start_row(row=row_index, worker=worker_name, payer=row[4].strip())
+                try:
+                    with journal.keep_alive(row_index, worker_name):
+                        outcome = handle_row(page, drive_service, journal, worker_name, row_index, row, shared, payer_index, reuse_form=same_payer)
+                    if outcome == "ok":
+                        streak = streak + 1 if same_payer else 1
+                        loaded_payer = payer_key(row)
+                    elif outcome == "error":
+                        # The page may be showing an error; the next row selects its payer from scratch.
+                        loaded_payer, streak = None, 0
+                    shared['loaded_payers'][worker_name] = loaded_payer
+                except Exception:
+                    timing.tag_row(outcome="exception")
+                    raise
+                finally:
+                    mode = "fast navigation" if FAST_NAVIGATION else f"legacy waits, slow_mo={LEGACY_SLOW_MO_MS}ms"
+                    print(f"-> [{worker_name}] Row {row_index} stage timings ({mode}): {timing.format_steps(timing.finish_row())}")
+                print_run_stats(shared)
+
+            except Exception as e:
+                print(f"-!- [{worker_name}] AN UNEXPECTED ERROR IN THE WORKER LOOP: {e}")
+                if row_index:
+                    try:
+                        if not journal.write_result(row_index, [f"Error: {type(e).__name__}", f"{e}", "", "N/A"], worker_name):
+                            print(f"-!- [{worker_name}] Row {row_index} is leased to another worker now. Leaving the error unrecorded.")
+                    except Exception as write_error:
+                        print(f"-!- [{worker_name}] Could not record the error for row {row_index}: {write_error}")
+                print(f"-!- [{worker_name}] Resetting state. Will re-navigate on next record...")
+                payer_index.clear()
+                loaded_payer, streak = None, 0
+                shared['loaded_payers'][worker_name] = None
+                try:
+                    if not browser.is_connected():
+                        print(f"-!- [{worker_name}] Browser disconnected. Relaunching...")
+                        browser = p.chromium.launch(headless=True, slow_mo=BROWSER_SLOW_MO)
+                        context, page = open_session(browser)
+                    elif page.is_closed() or not session_is_valid(page):
+                        print(f"-!- [{worker_name}] Page crashed or session expired. Opening a fresh session...")
+                        context.close()
+                        context, page = open_session(browser)
+                except Exception as recovery_error:
+                    print(f"-!- [{worker_name}] Session recovery failed: {recovery_error}. Waiting 60 seconds...")
+                    stop_event.wait(60)
+
+        browser.close()
 
 # --- MAIN BOT LOOP ---
 
 def main():
-    """Main function to run the bot loop."""
+    """Main function: authenticates, logs in once, then runs NUM_WORKERS parallel workers."""
     print("--- Eligibility Bot (AI Full Suite v5.3) Starting Up ---")
     if not GEMINI_API_KEY or "YOUR_GEMINI_API_KEY_HERE" in GEMINI_API_KEY:
         print("\n!!! FATAL ERROR: Please paste your Gemini API key and restart.")
@@ -240,90 +829,85 @@ def main():
 
     print("-> Authenticating with Google Services...")
     creds = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-    sheets_client = gspread.authorize(creds)
-    drive_service = build('drive', 'v3', credentials=creds)
-    sheet = sheets_client.open_by_key(SPREADSHEET_ID).worksheet(SHEET_NAME)
+    sheet = gspread.authorize(creds).open_by_key(SPREADSHEET_ID).worksheet(SHEET_NAME)
+    # The change probe gets its own Drive client; the gateway lock serializes its calls.
+    change_probe = drive_version_probe(build('drive', 'v3', credentials=creds), SPREADSHEET_ID) if SHEET_CHANGE_DETECTION else None
     print("-> Google Sheets & Drive authentication successful.")
+    timing.configure(METRICS_JSONL_FILE, METRICS_PROM_FILE, METRICS_WINDOW)
+
+    journal = WorkJournal(WORK_JOURNAL_FILE, lease_seconds=JOURNAL_LEASE_SECONDS, heartbeat_seconds=JOURNAL_HEARTBEAT_SECONDS,
+                          max_attempts=JOURNAL_MAX_ATTEMPTS,
+                          scheduler=PayerScheduler(SCHEDULER_MAX_PAYER_STREAK, SCHEDULER_MAX_ROW_WAIT_SECONDS))
+    shared = {
+        "payer_cache": PayerCache(PAYER_CACHE_FILE, max_failures=PAYER_CACHE_MAX_FAILURES),
+        "form_plan_cache": FormPlanCache(FORM_PLAN_CACHE_FILE),
+        "extraction_stats": ExtractionStats(),
+        # Sheet claims carry the journal's run id, so a restart that reuses this PID sees the old claims as stale.
+        "claimer": RowClaimer(CLAIM_LOCK_FILE, verify_delay=CLAIM_VERIFY_DELAY_SECONDS, run_id=journal.run_id),
+        "journal": journal,
+        "gateway": SheetGateway(sheet, batch_size=SHEET_WRITE_BATCH_SIZE, full_rescan_every=SHEET_FULL_RESCAN_EVERY,
+                                change_probe=change_probe, max_idle_seconds=CHECK_INTERVAL_SECONDS * SHEET_FULL_RESCAN_EVERY),
+        "loaded_payers": {}, # worker name -> payer key of the form it has open; ingest claims those payers first
+        "uploader": None,
+        "result_cache": ResultCache(RESULT_CACHE_FILE, RESULT_CACHE_TTL_HOURS * 3600, RESULT_CACHE_MAX_ENTRIES)
+                        if RESULT_CACHE_TTL_HOURS > 0 else None,
+    }
+
+    recovered = shared['journal'].recover(JOURNAL_RETENTION_HOURS * 3600)
+    if recovered['requeued'] or recovered['unwritten']:
+        print(f"-> Work journal: {recovered['requeued']} row(s) left in flight by a previous run will be checked again, "
+              f"{recovered['unwritten']} finished row(s) still need writing to the sheet.")
+        write_back(shared)
+
+    removed = prune_screenshot_dir(SCREENSHOT_DIR, SCREENSHOT_RETENTION_MAX_FILES, SCREENSHOT_RETENTION_MAX_AGE_DAYS)
+    if removed:
+        print(f"-> Removed {removed} old screenshot(s) from '{SCREENSHOT_DIR}'.")
+    if SCREENSHOT_BACKGROUND_UPLOADS:
+        shared['uploader'] = ScreenshotUploader(
+            creds, DRIVE_FOLDER_ID, max_workers=SCREENSHOT_UPLOAD_THREADS, max_in_flight=SCREENSHOT_MAX_IN_FLIGHT,
+            local_dir=SCREENSHOT_DIR if SCREENSHOT_KEEP_LOCAL else None,
+            retention_max_files=SCREENSHOT_RETENTION_MAX_FILES, retention_max_age_days=SCREENSHOT_RETENTION_MAX_AGE_DAYS,
+        )
 
+    # Make sure login_state.json is valid before the workers start, so the OTP prompt happens up front.
     with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True, slow_mo=50)
-        context, page = (None, None)
-        
-        if os.path.exists(STATE_FILE):
-            try:
-                print("-> Found saved session. Attempting to use...")
-                context = browser.new_context(storage_state=STATE_FILE)
-                page = context.new_page()
-                page.goto("https://mytools.gatewayedi.com/default.aspx", timeout=60000)
-                page.locator("#NavCtrl_navHome").wait_for(timeout=15000)
-                print("-> Session is valid. Login skipped.")
-            except Exception as e:
-                print(f"-> Session invalid: {e}. A new login is required.")
-                if context: context.close()
-                context = None
-        
-        if not context:
-            print("-> Performing new login to Trizetto...")
-            context = browser.new_context()
-            page = context.new_page()
-            page.goto("https://mytools.gatewayedi.com/LogOn")
-            page.fill('input[name="UserName"]', TRIZETTO_USERNAME)
-            page.fill('input[type="password"]', TRIZETTO_PASSWORD)
-            page.click('input[type="submit"]')
-            print("   - Handling OTP step...")
-            page.locator(f'text={OTP_EMAIL_ADDRESS_TEXT}').click()
-            otp_code = input(">>> Please check your email for the OTP and enter it here: ")
-            page.locator("#AuthCode").press_sequentially(otp_code, delay=100)
-            page.locator("#btnVerify").click()
-            page.wait_for_url("**/default.aspx**", timeout=30000)
-            print("-> LOGIN SUCCESSFUL! Saving session...")
-            context.storage_state(path=STATE_FILE)
-
-        while True:
-            try:
-                print(f"\n--- Checking for new records... ({time.ctime()}) ---")
-                all_rows = sheet.get_all_values()
-                
-                row_to_process, row_index_to_process = (None, -1)
-                for i, row in enumerate(all_rows[1:], start=2):
-                    if len(row) >= 6 and all(str(item).strip() for item in row[:6]) and (len(row) < 7 or not str(row[6]).strip()):
-                        row_to_process, row_index_to_process = row, i
-                        break
-
-                if row_to_process:
-                    current_payer = row_to_process[4].strip()
-                    print(f"-> Found record in row {row_index_to_process} for Payer: '{current_payer}'")
-                    
-                    sheet.update_cell(row_index_to_process, 7, "Processing...")
-
-                    select_payer_with_ai(page, current_payer)
-                    
-                    patient_data = {
-                        "dos": row_to_process[0], "first_name": row_to_process[1],
-                        "last_name": row_to_process[2], "dob": row_to_process[3],
-                        "payer_name": current_payer, "member_id": row_to_process[5]
-                    }
-
-                    results = process_patient(page, drive_service, patient_data)
-                    
-                    print(f"-> Writing results back to row {row_index_to_process}...")
-                    sheet.update_cell(row_index_to_process, 7, results.get("status", "Error"))
-                    sheet.update_cell(row_index_to_process, 8, results.get("policy_begin", ""))
-                    sheet.update_cell(row_index_to_process, 9, results.get("policy_end", ""))
-                    sheet.update_cell(row_index_to_process, 10, results.get("screenshot_link", "Upload Failed"))
-                    print("-> Sheet updated.")
-
-                else:
-                    print(f"-> No new records found. Waiting {CHECK_INTERVAL_SECONDS} seconds...")
-                    time.sleep(CHECK_INTERVAL_SECONDS)
+        browser = p.chromium.launch(headless=True)
+        context, _ = open_session(browser)
+        context.close()
+        browser.close()
+
+    # Three stages connected by the work journal: sheet ingestion, browser workers, result write-back.
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(target=run_ingester, name="ingest", args=(shared, stop_event), daemon=True),
+        threading.Thread(target=run_writer, name="writer", args=(shared, stop_event), daemon=True),
+    ]
+    for n in range(1, max(1, NUM_WORKERS) + 1):
+        threads.append(threading.Thread(target=run_worker, name=f"worker-{n}", args=(f"worker-{n}", creds, shared, stop_event), daemon=True))
+    for thread in threads:
+        thread.start()
+    print(f"-> Started {len(threads) - 2} worker(s) plus the ingest and write-back threads.")
 
-            except gspread.exceptions.APIError as e:
-                print(f"-!- GOOGLE SHEETS API ERROR: {e}. Waiting 5 minutes...")
-                time.sleep(300)
-            except Exception as e:
-                print(f"-!- AN UNEXPECTED ERROR IN THE MAIN LOOP: {e}")
-                print("-!- Resetting state. Will re-navigate on next record. Waiting 60 seconds...")
-                time.sleep(60)
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        print("\n-> Shutting down workers...")
+        stop_event.set()
+        for thread in threads:
+            thread.join(timeout=30)
+    if shared['uploader'] is not None:
+        print("-> Waiting for pending screenshot uploads...")
+        shared['uploader'].shutdown(wait=True)
+    # Only completed rows are written; rows a still-running worker holds stay leased for the next start's recovery.
+    write_back(shared)
+    busy = [thread.name for thread in threads if thread.is_alive()]
+    if busy:
+        # Their journal calls must not hit a closed connection; the rows they finish are written on the next start.
+        print(f"-!- Still busy at exit: {', '.join(busy)}. Leaving the work journal open for them.")
+    else:
+        shared['journal'].close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,237 @@
+# caches.py
+# Persistent on-disk caches that let the bot skip repeat Gemini round-trips and portal checks.
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+
+from report_extractor import normalize_date
+
+
+def normalize_payer_name(name: str) -> str:
+    """Lower-cases a payer name and collapses punctuation/whitespace so variants share a key."""
+    return re.sub(r"[^a-z0-9]+", " ", str(name).lower()).strip()
+
+
+class JsonFileStore:
+    """A thread-safe dict persisted to a JSON file with atomic replace-on-write."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.data = self._load()
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError) as e:
+            print(f"   -!- Could not read cache file '{self.path}', starting empty: {e}")
+            return {}
+
+    def save(self):
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.data, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"   -!- Could not write cache file '{self.path}': {e}")
+
+
+class PayerCache:
+    """
+    Maps a normalized payer name to the accordion link texts Gemini resolved for it.
+    Entries are evicted after `max_failures` consecutive failed validations or clicks.
+    """
+
+    def __init__(self, path: str, max_failures: int = 3):
+        self.store = JsonFileStore(path)
+        self.max_failures = max_failures
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def lookup(self, payer_name: str):
+        """Returns the cached {'category_text', 'payer_text'} entry, or None on a miss."""
+        key = normalize_payer_name(payer_name)
+        with self.store.lock:
+            entry = self.store.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            return {"category_text": entry["category_text"], "payer_text": entry["payer_text"]}
+
+    def put(self, payer_name: str, category_text: str, payer_text: str):
+        """Stores a freshly resolved pair and persists it."""
+        key = normalize_payer_name(payer_name)
+        with self.store.lock:
+            self.store.data[key] = {
+                "category_text": category_text,
+                "payer_text": payer_text,
+                "failures": 0,
+            }
+            self.store.save()
+
+    def confirm(self, payer_name: str):
+        """Records a successful use of a cached entry."""
+        key = normalize_payer_name(payer_name)
+        with self.store.lock:
+            self.hits += 1
+            entry = self.store.data.get(key)
+            if entry and entry.get("failures"):
+                entry["failures"] = 0
+                self.store.save()
+
+    def record_failure(self, payer_name: str) -> bool:
+        """Marks a cached entry as stale; returns True if it was evicted."""
+        key = normalize_payer_name(payer_name)
+        with self.store.lock:
+            self.stale += 1
+            entry = self.store.data.get(key)
+            if entry is None:
+                return False
+            entry["failures"] = entry.get("failures", 0) + 1
+            evicted = entry["failures"] >= self.max_failures
+            if evicted:
+                del self.store.data[key]
+                self.evictions += 1
+            self.store.save()
+            return evicted
+
+    def stats(self) -> dict:
+        with self.store.lock:
+            return {
+                "entries": len(self.store.data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+            }
+
+
+class FormPlanCache:
+    """
+    Remembers which form selector takes which patient field, per payer and form fingerprint.
+    Only the selector -> field mapping is stored, never patient values.
+    """
+
+    def __init__(self, path: str):
+        self.store = JsonFileStore(path)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, payer_name: str, fingerprint: str):
+        """Returns the cached [{'selector', 'field'}] mapping, or None on a miss or fingerprint change."""
+        key = normalize_payer_name(payer_name)
+        with self.store.lock:
+            entry = self.store.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.get("fingerprint") != fingerprint:
+                print("   - Form layout changed since it was cached. Invalidating form-fill plan...")
+                del self.store.data[key]
+                self.store.save()
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            return list(entry["fields"])
+
+    def put(self, payer_name: str, fingerprint: str, fields: list):
+        key = normalize_payer_name(payer_name)
+        with self.store.lock:
+            self.store.data[key] = {"fingerprint": fingerprint, "fields": fields}
+            self.store.save()
+
+    def invalidate(self, payer_name: str):
+        key = normalize_payer_name(payer_name)
+        with self.store.lock:
+            if self.store.data.pop(key, None) is not None:
+                self.invalidations += 1
+                self.store.save()
+
+    def stats(self) -> dict:
+        with self.store.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.store.data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def result_cache_key(patient_data: dict) -> str:
+    """Hashes the normalized member/patient/payer/DOS tuple so no patient identifiers are stored on disk."""
+    parts = [
+        re.sub(r"[^A-Z0-9]", "", str(patient_data.get("member_id", "")).upper()),
+        re.sub(r"[^a-z]", "", str(patient_data.get("last_name", "")).lower()),
+        normalize_date(patient_data.get("dob", "")) or str(patient_data.get("dob", "")).strip(),
+        normalize_payer_name(patient_data.get("payer_name", "")),
+        normalize_date(patient_data.get("dos", "")) or str(patient_data.get("dos", "")).strip(),
+    ]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    TTL cache of finished eligibility results (status, dates and screenshot link) so duplicate
+    rows inside the TTL are answered without touching the portal. Oldest entries go first when full.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int = 5000):
+        self.store = JsonFileStore(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._drop_expired()
+
+    def _drop_expired(self):
+        with self.store.lock:
+            cutoff = time.time() - self.ttl_seconds
+            expired = [key for key, entry in self.store.data.items() if entry.get("stored_at", 0) < cutoff]
+            for key in expired:
+                del self.store.data[key]
+            if expired:
+                self.store.save()
+
+    def lookup(self, patient_data: dict):
+        """Returns a copy of the cached result for this patient/payer/DOS, or None."""
+        key = result_cache_key(patient_data)
+        with self.store.lock:
+            entry = self.store.data.get(key)
+            if entry is None or time.time() - entry.get("stored_at", 0) > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(entry["result"])
+
+    def put(self, patient_data: dict, result: dict):
+        key = result_cache_key(patient_data)
+        with self.store.lock:
+            self.store.data[key] = {"stored_at": time.time(), "result": dict(result)}
+            if len(self.store.data) > self.max_entries:
+                self._drop_expired()
+                overflow = len(self.store.data) - self.max_entries
+                if overflow > 0:
+                    oldest = sorted(self.store.data, key=lambda k: self.store.data[k].get("stored_at", 0))[:overflow]
+                    for old_key in oldest:
+                        del self.store.data[old_key]
+            self.store.save()
+
+    def stats(self) -> dict:
+        with self.store.lock:
+            return {"entries": len(self.store.data), "hits": self.hits, "misses": self.misses}
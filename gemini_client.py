@@ -0,0 +1,123 @@
+# gemini_client.py
+# One shared, rate-limited Gemini client used by every AI helper in the bot.
+
+import re
+import json
+import time
+import random
+import threading
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from html_prune import estimate_tokens
+
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,   # 429
+    google_exceptions.TooManyRequests,     # 429
+    google_exceptions.InternalServerError, # 500
+    google_exceptions.BadGateway,          # 502
+    google_exceptions.ServiceUnavailable,  # 503
+    google_exceptions.GatewayTimeout,      # 504
+    google_exceptions.DeadlineExceeded,    # per-call timeout
+)
+
+CODE_FENCE_RE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.S | re.I)
+
+
+class GeminiResponseError(ValueError):
+    """Raised when Gemini's reply is not the JSON shape the caller asked for."""
+
+    def __init__(self, message: str, raw_text: str = ""):
+        super().__init__(message)
+        self.raw_text = raw_text
+
+
+def parse_json_response(text: str, expect=dict, required_keys=()):
+    """Strictly parses a JSON reply (optionally wrapped in one code fence) and checks its type and keys."""
+    cleaned = (text or "").strip()
+    fenced = CODE_FENCE_RE.match(cleaned)
+    if fenced:
+        cleaned = fenced.group(1)
+    try:
+        value = json.loads(cleaned)
+    except ValueError as e:
+        raise GeminiResponseError(f"AI response is not valid JSON: {e}", text) from e
+    if expect is not None and not isinstance(value, expect):
+        raise GeminiResponseError(f"AI response is a {type(value).__name__}, expected a {expect.__name__}", text)
+    items = value if isinstance(value, list) else [value]
+    for item in items:
+        missing = [key for key in required_keys if not isinstance(item, dict) or key not in item]
+        if missing:
+            raise GeminiResponseError(f"AI response is missing key(s): {', '.join(missing)}", text)
+    return value
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `per_minute` units per minute."""
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0):
+        """Blocks until `amount` units are available, then takes them."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class GeminiClient:
+    """
+    Wraps a single GenerativeModel with request/token rate limits, a concurrency cap,
+    per-call timeouts and exponential backoff with jitter on 429 and 5xx errors.
+    """
+
+    def __init__(self, api_key: str, model_name: str, requests_per_minute: float = 30, tokens_per_minute: float = 1_000_000,
+                 max_concurrency: int = 4, timeout: float = 60, max_retries: int = 4, max_backoff: float = 60):
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+
+    def generate(self, prompt: str, json_mode: bool = False) -> str:
+        """Returns the response text, retrying transient failures."""
+        prompt_tokens = estimate_tokens(prompt)
+        generation_config = {"response_mime_type": "application/json"} if json_mode else None
+        for attempt in range(self.max_retries + 1):
+            self.request_bucket.acquire()
+            self.token_bucket.acquire(prompt_tokens)
+            try:
+                with self.slots:
+                    response = self.model.generate_content(
+                        prompt,
+                        generation_config=generation_config,
+                        request_options={"timeout": self.timeout},
+                    )
+                return response.text
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(self.max_backoff, 2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"   -!- Gemini call failed ({type(e).__name__}). Retrying in {delay:.1f}s "
+                      f"(attempt {attempt + 1}/{self.max_retries})...")
+                time.sleep(delay)
+
+    def generate_json(self, prompt: str, expect=dict, required_keys=()):
+        """Asks for a JSON reply and parses it strictly; raises GeminiResponseError on a malformed reply."""
+        return parse_json_response(self.generate(prompt, json_mode=True), expect=expect, required_keys=required_keys)
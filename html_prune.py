@@ -0,0 +1,259 @@
+# html_prune.py
+# Shrinks page HTML before it is pasted into a Gemini prompt.
+
+from html import escape
+from html.parser import HTMLParser
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+DROP_TAGS = {"script", "style", "noscript", "svg", "template", "iframe", "head", "link", "meta", "object", "canvas", "img", "button"}
+UNWRAP_TAGS = {"div", "span", "font", "b", "i", "strong", "em", "center", "small", "section", "article", "main", "form", "fieldset"}
+KEEP_EMPTY_TAGS = {"input", "select", "textarea", "option", "td", "th", "dd", "br"}
+FORM_CONTROL_TAGS = {"input", "select", "textarea"}
+IGNORED_INPUT_TYPES = {"hidden", "submit", "button", "image", "reset", "file"}
+DEFAULT_KEEP_ATTRS = {"id", "name", "for", "type", "placeholder", "aria-label", "title", "colspan", "rowspan"}
+# Start tags that implicitly close a still-open sibling (e.g. an unclosed <dt> before a <dd>).
+IMPLIED_END_TAGS = {
+    "dt": {"dt", "dd"}, "dd": {"dt", "dd"}, "li": {"li"}, "option": {"option"}, "p": {"p"},
+    "tr": {"tr", "td", "th"}, "td": {"td", "th"}, "th": {"td", "th"},
+}
+BLOCK_TAGS = {"div", "p", "li", "ul", "ol", "section", "article", "br", "tr", "table", "dl", "form", "fieldset", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+
+class _Node:
+    __slots__ = ("tag", "attrs", "children")
+
+    def __init__(self, tag, attrs=None):
+        self.tag = tag
+        self.attrs = attrs or {}
+        self.children = []
+
+
+class _TreeBuilder(HTMLParser):
+    """Builds a lenient element tree; comments and doctypes are dropped."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _Node("root")
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        node = _Node(tag, {k: (v if v is not None else "") for k, v in attrs})
+        closes = IMPLIED_END_TAGS.get(tag, ())
+        while len(self.stack) > 1 and self.stack[-1].tag in closes:
+            self.stack.pop()
+        self.stack[-1].children.append(node)
+        if tag not in VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.stack[-1].children.append(_Node(tag, {k: (v if v is not None else "") for k, v in attrs}))
+
+    def handle_endtag(self, tag):
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+
+def parse_html(html: str) -> _Node:
+    """Parses HTML into a lenient tree of nodes (tag, attrs, children); text children are plain strings."""
+    builder = _TreeBuilder()
+    builder.feed(html or "")
+    builder.close()
+    return builder.root
+
+
+def _is_hidden(node: _Node) -> bool:
+    attrs = node.attrs
+    if "hidden" in attrs or attrs.get("aria-hidden", "").lower() == "true":
+        return True
+    if node.tag == "input" and attrs.get("type", "").lower() == "hidden":
+        return True
+    style = attrs.get("style", "").replace(" ", "").lower()
+    return "display:none" in style or "visibility:hidden" in style
+
+
+def _text_of(node) -> str:
+    if isinstance(node, str):
+        return node
+    if node.tag in DROP_TAGS:
+        return ""
+    return " ".join(_text_of(child) for child in node.children)
+
+
+def _clean_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def element_text(node) -> str:
+    """Returns the whitespace-collapsed visible text of a parsed node."""
+    return _clean_text(_text_of(node))
+
+
+def _render(node, keep_attrs, drop_hidden, out):
+    if isinstance(node, str):
+        text = _clean_text(node)
+        if text:
+            out.append(escape(text, quote=False))
+        return
+    if node.tag in DROP_TAGS or (drop_hidden and _is_hidden(node)):
+        return
+    inner = []
+    for child in node.children:
+        _render(child, keep_attrs, drop_hidden, inner)
+    if node.tag == "root":
+        out.extend(inner)
+        return
+    attrs = "".join(f' {k}="{escape(v)}"' for k, v in node.attrs.items() if k in keep_attrs)
+    if not inner and node.tag not in KEEP_EMPTY_TAGS and not attrs:
+        return
+    if node.tag in UNWRAP_TAGS and not attrs:
+        out.extend(inner)
+        return
+    if node.tag in VOID_TAGS:
+        out.append(f"<{node.tag}{attrs}>")
+    else:
+        out.append(f"<{node.tag}{attrs}>{''.join(inner)}</{node.tag}>")
+
+
+def prune_html(html: str, keep_attrs=None, drop_hidden: bool = True) -> str:
+    """
+    Removes scripts, styles, comments, SVG, (optionally) hidden elements and all
+    attributes outside `keep_attrs`, and unwraps attribute-less layout wrappers.
+    """
+    out = []
+    _render(parse_html(html), keep_attrs or DEFAULT_KEEP_ATTRS, drop_hidden, out)
+    return "".join(out)
+
+
+def compact_form_html(html: str) -> str:
+    """Reduces a page to its visible text inputs, selects and textareas, each with its label (by id or wrapping it)."""
+    root = parse_html(html)
+    labels_for = {}
+    controls = []
+    state = {"last_text": ""}
+
+    def walk(node, enclosing_label):
+        if isinstance(node, str):
+            text = _clean_text(node)
+            if text:
+                state["last_text"] = text
+            return
+        if node.tag in DROP_TAGS or _is_hidden(node):
+            return
+        if node.tag == "label":
+            label_text = _clean_text(_text_of(node))
+            if node.attrs.get("for"):
+                labels_for[node.attrs["for"]] = label_text
+            enclosing_label = label_text
+        if node.tag in FORM_CONTROL_TAGS:
+            if node.attrs.get("type", "text").lower() not in IGNORED_INPUT_TYPES:
+                controls.append((node, enclosing_label or state["last_text"]))
+                state["last_text"] = ""
+            if node.tag != "select":
+                return
+        for child in node.children:
+            walk(child, enclosing_label)
+
+    walk(root, "")
+
+    lines = []
+    for node, nearby_text in controls:
+        label = labels_for.get(node.attrs.get("id", ""), nearby_text)
+        attrs = "".join(f' {k}="{escape(v)}"' for k, v in node.attrs.items() if k in DEFAULT_KEEP_ATTRS)
+        if not label or len(label) > 120:
+            lines.append(f"<{node.tag}{attrs}>")
+        elif node.attrs.get("id"):
+            lines.append(f'<label for="{escape(node.attrs["id"])}">{escape(label, quote=False)}</label>')
+            lines.append(f"<{node.tag}{attrs}>")
+        else:
+            # No id to point at: wrap the control, so the label stays tied to it (and its name, if any).
+            lines.append(f"<label>{escape(label, quote=False)} <{node.tag}{attrs}></label>")
+    return "\n".join(lines)
+
+
+def compact_report_html(html: str) -> str:
+    """Flattens a report to plain text: headings, 'term: value' lines for <dl>, and pipe-separated table rows."""
+    lines = []
+    current = []
+
+    def flush():
+        text = _clean_text(" ".join(current))
+        if text:
+            lines.append(text)
+        current.clear()
+
+    def walk(node):
+        if isinstance(node, str):
+            current.append(node)
+            return
+        if node.tag in DROP_TAGS or _is_hidden(node):
+            return
+        if node.tag == "table":
+            flush()
+            for row in _find_all(node, "tr"):
+                cells = [_clean_text(_text_of(cell)) for cell in row.children if not isinstance(cell, str) and cell.tag in ("td", "th")]
+                if any(cells):
+                    lines.append(" | ".join(cells))
+            return
+        if node.tag == "dl":
+            flush()
+            term = None
+            for child in node.children:
+                if isinstance(child, str) or _is_hidden(child):
+                    continue
+                if child.tag == "dt":
+                    term = _clean_text(_text_of(child))
+                elif child.tag == "dd":
+                    value = _clean_text(_text_of(child))
+                    lines.append(f"{term.rstrip(':')}: {value}" if term else value)
+                    term = None
+                else:
+                    walk(child)
+                    flush()
+            return
+        if node.tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            flush()
+            heading = _clean_text(_text_of(node))
+            if heading:
+                lines.append(f"## {heading}")
+            return
+        block = node.tag in BLOCK_TAGS
+        if block:
+            flush()
+        for child in node.children:
+            walk(child)
+        if block:
+            flush()
+
+    walk(parse_html(html))
+    flush()
+    return "\n".join(lines)
+
+
+def _find_all(node, tag):
+    found = []
+    for child in node.children:
+        if isinstance(child, str):
+            continue
+        if child.tag == tag:
+            found.append(child)
+        elif child.tag != "table":
+            found.extend(_find_all(child, tag))
+    return found
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token estimate (about 4 bytes per token for HTML/English)."""
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def log_reduction(label: str, before: str, after: str):
+    """Prints how much a pruning step shrank a prompt payload."""
+    before_bytes, after_bytes = len(before.encode("utf-8")), len(after.encode("utf-8"))
+    saved = 1 - after_bytes / before_bytes if before_bytes else 0.0
+    print(f"   - Pruned {label} HTML: {before_bytes:,} -> {after_bytes:,} bytes "
+          f"(~{estimate_tokens(before):,} -> ~{estimate_tokens(after):,} tokens, -{saved:.0%}).")
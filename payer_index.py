@@ -0,0 +1,174 @@
+# payer_index.py
+# In-memory index of the #InsurerAccordion payer list with a fast local fuzzy matcher.
+
+import re
+from difflib import SequenceMatcher
+from html.parser import HTMLParser
+
+# Common abbreviations used on the sheet, expanded before matching.
+PAYER_ALIASES = {
+    "bcbs": "blue cross blue shield",
+    "bc": "blue cross",
+    "bs": "blue shield",
+    "uhc": "united healthcare",
+    "unitedhealthcare": "united healthcare",
+    "umr": "umr wausau",
+    "aarp": "aarp united healthcare",
+    "bcbsnc": "blue cross blue shield north carolina",
+    "hcsc": "health care service corporation",
+    "hmo": "health maintenance organization",
+    "ppo": "preferred provider organization",
+    "mcd": "medicaid",
+    "mcr": "medicare",
+    "nc": "north carolina",
+    "sc": "south carolina",
+    "ny": "new york",
+    "tx": "texas",
+    "fl": "florida",
+    "ca": "california",
+}
+
+STOPWORDS = {"the", "of", "inc", "co", "company", "plan", "plans", "insurance", "ins", "and"}
+
+
+def normalize(text: str, expand_aliases: bool = True) -> str:
+    """Lower-cases, strips punctuation and (unless `expand_aliases` is False) expands known aliases."""
+    tokens = re.sub(r"[^a-z0-9]+", " ", str(text).lower()).split()
+    expanded = []
+    for token in tokens:
+        expanded.extend((PAYER_ALIASES.get(token, token) if expand_aliases else token).split())
+    return " ".join(t for t in expanded if t not in STOPWORDS)
+
+
+def score_match(query: str, candidate: str) -> float:
+    """Scores two normalized names between 0 and 1 using token overlap and edit distance."""
+    if not query or not candidate:
+        return 0.0
+    if query == candidate:
+        return 1.0
+    query_tokens, candidate_tokens = set(query.split()), set(candidate.split())
+    overlap = len(query_tokens & candidate_tokens)
+    containment = overlap / len(query_tokens)
+    jaccard = overlap / len(query_tokens | candidate_tokens)
+    ratio = SequenceMatcher(None, query, candidate).ratio()
+    return round(0.45 * containment + 0.25 * jaccard + 0.30 * ratio, 4)
+
+
+class _AccordionParser(HTMLParser):
+    """Collects category -> payer link texts from the accordion's inner HTML."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.categories = {}
+        self.stack = []
+        self.category_id = None
+        self.category_depth = None
+        self.in_category_link = False
+        self.detail_depth = None
+        self.link_depth = None
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        self.stack.append(tag)
+        depth = len(self.stack)
+        if tag == "li" and attrs.get("id") and self.detail_depth is None:
+            self.category_id = attrs["id"]
+            self.category_depth = depth
+            self.categories.setdefault(self.category_id, [])
+        elif self.category_id and tag == "ul" and "insurersDetail" in classes:
+            self.detail_depth = depth
+        elif self.category_id and tag == "a":
+            self.link_depth = depth
+            self.in_category_link = self.detail_depth is None
+            self.text = []
+
+    def handle_endtag(self, tag):
+        if tag not in self.stack:
+            return
+        while self.stack:
+            depth = len(self.stack)
+            closed = self.stack.pop()
+            if depth == self.link_depth:
+                text = " ".join("".join(self.text).split())
+                if text and not self.in_category_link and text not in self.categories[self.category_id]:
+                    self.categories[self.category_id].append(text)
+                self.link_depth = None
+            if depth == self.detail_depth:
+                self.detail_depth = None
+            if depth == self.category_depth:
+                self.category_id = self.category_depth = None
+            if closed == tag:
+                break
+
+    def handle_data(self, data):
+        if self.link_depth is not None:
+            self.text.append(data)
+
+
+class PayerIndex:
+    """Category -> payer link texts parsed once per browser session from #InsurerAccordion."""
+
+    def __init__(self):
+        self.categories = {}
+        self.entries = []
+
+    def is_empty(self) -> bool:
+        return not self.entries
+
+    def clear(self):
+        self.categories = {}
+        self.entries = []
+
+    def build_from_html(self, accordion_html: str):
+        """Parses the accordion's inner HTML into the index."""
+        parser = _AccordionParser()
+        parser.feed(accordion_html)
+        parser.close()
+        self.categories = {cat: payers for cat, payers in parser.categories.items() if payers}
+        # Portal names are matched both as written and alias-expanded ("UMR" vs "UMR-Wausau"), keeping the better score.
+        self.entries = [
+            (category, payer, {normalize(payer, expand_aliases=False), normalize(payer)}, normalize(category))
+            for category, payers in self.categories.items()
+            for payer in payers
+        ]
+        return self
+
+    def contains(self, category_text: str, payer_text: str) -> bool:
+        return payer_text in self.categories.get(category_text, [])
+
+    def candidates(self, payer_name: str, limit: int = 5) -> list:
+        """
+        Returns the top `limit` matches as dicts with category_text, payer_text, score and exact
+        (the normalized names are identical, decided before any category bonus).
+        """
+        query = normalize(payer_name)
+        scored = []
+        for category, payer, norm_payers, norm_category in self.entries:
+            exact = query in norm_payers
+            score = max(score_match(query, norm_payer) for norm_payer in norm_payers)
+            # Small bonus when the query also names the category (e.g. "BCBS North Carolina").
+            if norm_category and set(norm_category.split()) <= set(query.split()):
+                score = min(1.0, score + 0.05)
+            scored.append({"category_text": category, "payer_text": payer, "score": score, "exact": exact})
+        scored.sort(key=lambda c: (c["exact"], c["score"]), reverse=True)
+        return scored[:limit]
+
+    def resolve(self, payer_name: str, min_score: float = 0.85, min_margin: float = 0.08):
+        """
+        Returns (best_match, candidates). best_match is None when the local matcher
+        is not confident enough and the candidates should go to Gemini instead.
+        Only a unique exact name match skips the margin check; a score lifted to 1.0 by the
+        category bonus must still beat the runner-up by `min_margin`.
+        """
+        candidates = self.candidates(payer_name)
+        if not candidates:
+            return None, []
+        best = candidates[0]
+        runner_up = candidates[1] if len(candidates) > 1 else {"score": 0.0, "exact": False}
+        if best["exact"] and not runner_up["exact"]:
+            return best, candidates
+        if best["score"] >= min_score and best["score"] - runner_up["score"] >= min_margin:
+            return best, candidates
+        return None, candidates
@@ -0,0 +1,162 @@
+# report_extractor.py
+# Rule-based extraction of status and plan dates from the Trizetto eligibility report.
+
+import re
+import threading
+
+from html_prune import parse_html, element_text, compact_report_html
+
+PRIMARY_SECTION_RE = re.compile(r"health\s+benefit\s+plan\s+coverage", re.I)
+STATUS_LABEL_RE = re.compile(r"^(eligibility\s+)?status$", re.I)
+BEGIN_LABEL_RE = re.compile(r"^(plan|policy|coverage|eligibility)\s+(begin|start|effective)(\s+date)?$", re.I)
+END_LABEL_RE = re.compile(r"^(plan|policy|coverage|eligibility)\s+(end|term|termination)(\s+date)?$", re.I)
+RANGE_LABEL_RE = re.compile(r"^(plan|policy|coverage|eligibility)(\s+(begin\s*-\s*end|period))?\s+dates?$", re.I)
+
+DATE_RE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{2,4})|(\d{4})-(\d{2})-(\d{2})|\b(\d{4})(\d{2})(\d{2})\b")
+
+
+def normalize_date(text: str):
+    """Returns the first date in `text` as MM/DD/YYYY, or None."""
+    match = DATE_RE.search(text or "")
+    if not match:
+        return None
+    g = match.groups()
+    if g[0]:
+        month, day, year = int(g[0]), int(g[1]), int(g[2])
+        if year < 100:
+            year += 2000
+    elif g[3]:
+        year, month, day = int(g[3]), int(g[4]), int(g[5])
+    else:
+        year, month, day = int(g[6]), int(g[7]), int(g[8])
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return f"{month:02d}/{day:02d}/{year:04d}"
+
+
+def split_date_range(text: str):
+    """Splits '1/1/2025 - 12/31/2025' (or '20250101-20251231') into normalized (begin, end); missing parts are None."""
+    dates = [normalize_date(m.group(0)) for m in DATE_RE.finditer(text or "")]
+    dates = [d for d in dates if d]
+    if len(dates) >= 2:
+        return dates[0], dates[1]
+    if len(dates) == 1:
+        return dates[0], None
+    return None, None
+
+
+def _label_value_pairs(report_text: str):
+    """Turns compacted report lines into (section, label, value) triples."""
+    section = ""
+    pairs = []
+    for line in report_text.splitlines():
+        if line.startswith("## "):
+            section = line[3:]
+            continue
+        cells = [c.strip() for c in line.split(" | ")]
+        if len(cells) == 2 and cells[0]:
+            label, value = cells
+        elif ":" in line and "|" not in line:
+            label, value = line.split(":", 1)
+        else:
+            if len(line) <= 80 and not DATE_RE.search(line):
+                section = line
+            continue
+        label = " ".join(label.replace(":", " ").split())
+        pairs.append((section, label, value.strip()))
+    return pairs
+
+
+def _find_date(pairs, pick):
+    """Returns the distinct normalized dates found for the plan begin (pick 0) or end (pick 1)."""
+    found = []
+    for _, label, value in pairs:
+        begin, end = split_date_range(value)
+        if BEGIN_LABEL_RE.match(label) or RANGE_LABEL_RE.match(label):
+            # "Plan Begin Date: 1/1/2025 - 12/31/2025" carries both ends of the range.
+            date = (begin, end)[pick]
+        elif END_LABEL_RE.match(label):
+            date = (end or begin) if pick == 1 else None
+        else:
+            continue
+        if date and date not in found:
+            found.append(date)
+    return found
+
+
+def extract_report(report_html: str):
+    """
+    Extracts {'status', 'policy_begin', 'policy_end'} from the #eligibilityRequestResponse HTML.
+    Returns (data, confidence) where confidence is between 0 and 1.
+    """
+    confidence = 0.0
+    data = {"status": "Not Found", "policy_begin": "Not Found", "policy_end": "Not Found"}
+    root = parse_html(report_html)
+
+    status_node = _find_by_id(root, "trnEligibilityStatus")
+    pairs = _label_value_pairs(compact_report_html(report_html))
+    primary = [p for p in pairs if PRIMARY_SECTION_RE.search(p[0])]
+
+    if status_node is not None and element_text(status_node):
+        data["status"] = element_text(status_node)
+        confidence += 0.4
+    else:
+        for scope, weight in ((primary, 0.35), (pairs, 0.25)):
+            statuses = [v for _, label, v in scope if STATUS_LABEL_RE.match(label) and v]
+            if statuses:
+                data["status"] = statuses[0]
+                confidence += weight
+                break
+
+    for key, pick in (("policy_begin", 0), ("policy_end", 1)):
+        if primary:
+            # Once the primary block exists, sub-benefit dates (Vision, Dental...) must never stand in for its fields;
+            # a missing field stays Not Found and the low confidence sends the report to Gemini.
+            in_primary = _find_date(primary, pick)
+            if in_primary:
+                data[key] = in_primary[0]
+                confidence += 0.3
+            continue
+        anywhere = _find_date(pairs, pick)
+        if len(anywhere) == 1:
+            data[key] = anywhere[0]
+            confidence += 0.2
+        elif anywhere:
+            # Several sub-benefits disagree and the primary block was not found.
+            data[key] = anywhere[0]
+            confidence += 0.05
+
+    return data, round(min(confidence, 1.0), 2)
+
+
+def _find_by_id(node, element_id):
+    if isinstance(node, str):
+        return None
+    if node.attrs.get("id") == element_id:
+        return node
+    for child in node.children:
+        found = _find_by_id(child, element_id)
+        if found is not None:
+            return found
+    return None
+
+
+class ExtractionStats:
+    """Counts and latencies per extraction path ('rules' or 'ai')."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paths = {}
+
+    def record(self, path: str, seconds: float):
+        with self.lock:
+            count, total = self.paths.get(path, (0, 0.0))
+            self.paths[path] = (count + 1, total + seconds)
+
+    def summary(self) -> str:
+        with self.lock:
+            if not self.paths:
+                return "no reports parsed yet"
+            return ", ".join(
+                f"{path}: {count} (avg {total / count:.2f}s)" for path, (count, total) in sorted(self.paths.items())
+            )
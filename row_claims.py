@@ -0,0 +1,125 @@
+# row_claims.py
+# Atomic claiming of unprocessed sheet rows so no two workers check the same patient.
+
+import os
+import re
+import time
+import socket
+import threading
+from contextlib import contextmanager
+
+from scheduler import claim_order
+
+try:
+    import fcntl
+except ImportError: # Windows: only in-process locking is available.
+    fcntl = None
+
+CLAIM_PREFIX = "Processing..."
+# "[host:pid:run_id:worker]"; tokens written before run ids existed are "[host:pid:worker]".
+CLAIM_OWNER_RE = re.compile(r"\[([^\]:]+):(\d+):(?:([^\]:]+):)?[^\]:]*\]")
+
+
+def owner_is_alive(host: str, pid: int, run_id: str = None, current_run: str = None) -> bool:
+    """
+    False only when the owner is known to be gone: on this host, and either this process's PID under
+    another run id (a restarted container gets the same PID back) or a PID that no longer exists.
+    """
+    if host != socket.gethostname():
+        return True
+    if pid == os.getpid():
+        return run_id is None or run_id == current_run
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError: # The process exists but belongs to another user.
+        return True
+    return True
+
+
+def claim_is_stale(status: str, current_run: str = None) -> bool:
+    """True for a Processing... token left behind by an earlier run on this host that has since ended."""
+    status = str(status).strip()
+    if not status.startswith(CLAIM_PREFIX):
+        return False
+    match = CLAIM_OWNER_RE.search(status)
+    return bool(match) and not owner_is_alive(match.group(1), int(match.group(2)), match.group(3), current_run)
+
+
+def row_is_pending(row: list, current_run: str = None) -> bool:
+    """
+    A row is pending when its six input columns are filled and its Status column is empty
+    or holds a stale claim from an ended bot run on this host. Callers skip rows still in their
+    work journal, whose claims recovery has already taken over.
+    """
+    if len(row) < 6 or not all(str(item).strip() for item in row[:6]):
+        return False
+    return len(row) < 7 or not str(row[6]).strip() or claim_is_stale(row[6], current_run)
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive advisory lock shared by every bot process on this machine."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class RowClaimer:
+    """
+    Claims rows by writing an owner-tagged "Processing..." token to the Status column.
+    Threads are serialized with a lock, processes on the same host with a lock file,
+    and processes on other hosts by reading the token back after `verify_delay` seconds.
+    `run_id` (the work journal's) tells this run's tokens apart from an earlier run that had the same PID.
+    """
+
+    def __init__(self, lock_path: str, verify_delay: float = 1.0, run_id: str = None):
+        self.lock_path = lock_path
+        self.verify_delay = verify_delay
+        self.run_id = run_id
+        self.thread_lock = threading.Lock()
+        self.in_flight = set()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}" + (f":{run_id}" if run_id else "")
+
+    def token_for(self, worker_name: str) -> str:
+        return f"{CLAIM_PREFIX} [{self.owner}:{worker_name}]"
+
+    def claim_many(self, gateway, worker_name: str, limit: int, skip=(), loaded_payers=()) -> list:
+        """
+        Claims up to `limit` pending rows with one scan and one verify delay; returns [(row_index, row)].
+        Rows in `skip` (e.g. already queued locally) are left alone, and rows of `loaded_payers`
+        (payer keys whose form a worker has open) are preferred, see scheduler.claim_order.
+        """
+        token = self.token_for(worker_name)
+        with self.thread_lock, _file_lock(self.lock_path):
+            pending = [(i, row) for i, row in gateway.scan_rows()
+                       if i not in self.in_flight and i not in skip and row_is_pending(row, self.run_id)]
+            if not pending:
+                gateway.mark_idle()
+                return []
+            batch = claim_order(pending, loaded_payers, limit)
+            for i, _ in batch:
+                gateway.write_status(i, token)
+            if self.verify_delay:
+                time.sleep(self.verify_delay)
+            claimed = []
+            for i, row in batch:
+                if gateway.read_status(i) != token:
+                    print(f"   - Row {i} was claimed by another bot process. Skipping...")
+                    continue
+                self.in_flight.add(i)
+                claimed.append((i, row))
+            return claimed
+
+    def release(self, row_index: int):
+        with self.thread_lock:
+            self.in_flight.discard(row_index)
@@ -0,0 +1,70 @@
+# scheduler.py
+# Payer-grouped ordering of pending rows, with streak and age limits for fairness.
+
+import time
+
+from caches import normalize_payer_name
+
+
+def payer_key(row: list) -> str:
+    return normalize_payer_name(row[4]) if len(row) > 4 else ""
+
+
+def claim_order(pending: list, loaded_payers, limit: int) -> list:
+    """
+    Picks up to `limit` sheet rows to claim for the work journal, so PayerScheduler has payer groups to work with.
+    Up to half the batch goes to payers whose form a worker has loaded; the rest is filled with the oldest
+    rows (in sheet order), whole payer groups at a time, so every payer still keeps moving.
+    """
+    groups = {}
+    for item in pending:
+        groups.setdefault(payer_key(item[1]), []).append(item)
+    loaded = [item for payer in dict.fromkeys(loaded_payers) if payer in groups for item in groups[payer]]
+    batch = loaded[:(limit + 1) // 2]
+    taken = {row_index for row_index, _ in batch}
+    for payer_rows in groups.values(): # dicts keep insertion order, i.e. each payer's oldest row first
+        batch += [item for item in payer_rows if item[0] not in taken][:limit - len(batch)]
+        if len(batch) >= limit:
+            break
+    return batch
+
+
+class PayerScheduler:
+    """
+    Orders pending rows so a worker keeps checking patients of the payer whose form it already
+    has loaded. A worker gives up its payer after `max_streak` consecutive rows, and any row that
+    has waited longer than `max_wait_seconds` jumps the queue, so one big payer group cannot
+    starve the others.
+    """
+
+    def __init__(self, max_streak: int = 10, max_wait_seconds: float = 600):
+        self.max_streak = max_streak
+        self.max_wait_seconds = max_wait_seconds
+
+    def order(self, pending: list, current_payer: str = None, streak: int = 0, enqueued_at: dict = None) -> list:
+        """
+        Returns the pending (row_index, row) pairs in the order a worker should take them.
+        `enqueued_at` maps row_index -> time.time() the row was queued (the work journal's enqueued_at),
+        so a row keeps its age across restarts; rows missing from it count as queued just now.
+        """
+        if not pending:
+            return []
+        now = time.time()
+        enqueued_at = enqueued_at or {}
+        by_age = sorted(pending, key=lambda item: (enqueued_at.get(item[0], now), item[0]))
+        oldest_wait = now - enqueued_at.get(by_age[0][0], now)
+
+        groups = {}
+        for item in by_age:
+            groups.setdefault(payer_key(item[1]), []).append(item)
+        print(f"   - {len(pending)} pending row(s) across {len(groups)} payer(s).")
+
+        if oldest_wait > self.max_wait_seconds:
+            print(f"   - Row {by_age[0][0]} has waited {oldest_wait:.0f}s. Taking it first.")
+            return by_age
+        same = groups.get(current_payer, []) if current_payer else []
+        others = [item for item in by_age if current_payer is None or payer_key(item[1]) != current_payer]
+        if same and streak < self.max_streak:
+            return same + others
+        # Streak limit reached (or nothing left for this payer): start the oldest other group.
+        return others + same
@@ -0,0 +1,131 @@
+# screenshot_uploader.py
+# Background Google Drive upload pipeline for in-memory screenshots, plus local folder retention.
+
+import io
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseUpload
+
+import timing
+
+
+def prune_screenshot_dir(directory: str, max_files: int = None, max_age_days: float = None) -> int:
+    """Deletes the oldest files in `directory` beyond `max_files` or older than `max_age_days`; returns how many."""
+    if not os.path.isdir(directory):
+        return 0
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            entries.append((os.path.getmtime(path), path))
+    entries.sort(reverse=True)
+    cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+    removed = 0
+    for position, (mtime, path) in enumerate(entries):
+        if (max_files is not None and position >= max_files) or (cutoff is not None and mtime < cutoff):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                print(f"   -!- Could not delete old screenshot '{path}': {e}")
+    return removed
+
+
+class ScreenshotUploader:
+    """
+    Uploads screenshot bytes to Drive on a small thread pool so the browser never waits on Drive.
+    At most `max_in_flight` uploads are queued or running; submit() blocks beyond that.
+    Each finished upload calls its `on_done(link)` callback with the webViewLink or "Drive Upload Failed".
+    """
+
+    def __init__(self, creds, folder_id: str, max_workers: int = 2, max_in_flight: int = 8, max_retries: int = 3,
+                 local_dir: str = None, retention_max_files: int = None, retention_max_age_days: float = None):
+        self.creds = creds
+        self.folder_id = folder_id
+        self.max_retries = max_retries
+        self.local_dir = local_dir
+        self.retention_max_files = retention_max_files
+        self.retention_max_age_days = retention_max_age_days
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="drive-upload")
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.local = threading.local()
+        self.saved_since_prune = 0
+        self.lock = threading.Lock()
+
+    def _drive(self):
+        # googleapiclient services are not thread-safe, so each upload thread gets its own.
+        if not hasattr(self.local, "service"):
+            self.local.service = build('drive', 'v3', credentials=self.creds)
+        return self.local.service
+
+    def submit(self, file_name: str, data: bytes, mimetype: str, on_done=None):
+        """Queues an upload; blocks while `max_in_flight` uploads are already pending."""
+        self.slots.acquire()
+        try:
+            return self.executor.submit(self._run, file_name, data, mimetype, on_done)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def _run(self, file_name, data, mimetype, on_done):
+        try:
+            if self.local_dir:
+                self._save_local(file_name, data)
+            link = self._upload_with_retries(file_name, data, mimetype)
+        finally:
+            self.slots.release()
+        if on_done is not None:
+            try:
+                on_done(link)
+            except Exception as e:
+                print(f"   -!- Recording the screenshot link for '{file_name}' failed: {e}")
+        return link
+
+    @timing.traced("drive_upload")
+    def _upload_with_retries(self, file_name, data, mimetype) -> str:
+        for attempt in range(self.max_retries + 1):
+            try:
+                print(f"   - Uploading '{file_name}' to Google Drive in the background...")
+                media = MediaIoBaseUpload(io.BytesIO(data), mimetype=mimetype, resumable=True)
+                drive_service = self._drive()
+                file = drive_service.files().create(
+                    body={'name': file_name, 'parents': [self.folder_id]},
+                    media_body=media,
+                    fields='id, webViewLink'
+                ).execute()
+                drive_service.permissions().create(fileId=file.get('id'), body={'type': 'anyone', 'role': 'reader'}).execute()
+                print(f"   - Upload of '{file_name}' successful.")
+                return file.get('webViewLink')
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    print(f"   -!- Google Drive upload of '{file_name}' failed: {e}")
+                    return "Drive Upload Failed"
+                delay = (2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"   -!- Drive upload error: {e}. Retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
+    def _save_local(self, file_name, data):
+        try:
+            os.makedirs(self.local_dir, exist_ok=True)
+            with open(os.path.join(self.local_dir, file_name), "wb") as f:
+                f.write(data)
+        except OSError as e:
+            print(f"   -!- Could not save local copy of '{file_name}': {e}")
+            return
+        with self.lock:
+            self.saved_since_prune += 1
+            due = self.saved_since_prune >= 25
+            if due:
+                self.saved_since_prune = 0
+        if due:
+            removed = prune_screenshot_dir(self.local_dir, self.retention_max_files, self.retention_max_age_days)
+            if removed:
+                print(f"   - Removed {removed} old screenshot(s) from '{self.local_dir}'.")
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
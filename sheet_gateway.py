@@ -0,0 +1,231 @@
+# sheet_gateway.py
+# Single, thread-safe access point to the Google Sheet: incremental reads, batched writes, adaptive backoff.
+
+import time
+import random
+import threading
+
+import gspread
+
+import timing
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+STATUS_COL_LETTER = "G"
+LAST_COL_LETTER = "J"
+
+
+def _status_code(error) -> int:
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", 0) or 0
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def drive_version_probe(drive_service, file_id: str):
+    """Change signal for the spreadsheet: its Drive `version`, which increases on every edit."""
+    def probe():
+        return drive_service.files().get(fileId=file_id, fields="version").execute().get("version")
+    return probe
+
+
+class AdaptivePollInterval:
+    """Idle wait that starts at `min_interval`, grows by `factor` while nothing changes, and resets on activity."""
+
+    def __init__(self, min_interval: float = 5.0, max_interval: float = 60.0, factor: float = 1.5):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.factor = factor
+        self.current = None
+
+    def reset(self):
+        self.current = None
+
+    def next_interval(self) -> float:
+        self.current = self.min_interval if self.current is None else min(self.max_interval, self.current * self.factor)
+        return self.current
+
+
+class SheetGateway:
+    """
+    Wraps one gspread worksheet for all workers.
+    - Reads only the rows at or after a scan cursor (rows before it are known to be done),
+      with a periodic full rescan to pick up rows someone reset by hand.
+    - Writes a row's G:J results as one range, optionally buffering several rows into one batch_update.
+    - Paces calls and backs off adaptively on quota (429) and server (5xx) errors; the waits happen
+      outside the gateway lock, so a backoff never blocks threads that are not calling Sheets.
+    - With a `change_probe` (e.g. drive_version_probe), skips scans while the sheet is unchanged
+      since the last scan that found nothing pending, but still does a full rescan at least every
+      `max_idle_seconds`: a claim left by a dead bot process goes stale without changing the sheet.
+    """
+
+    def __init__(self, sheet, batch_size: int = 1, full_rescan_every: int = 20,
+                 min_interval: float = 0.0, max_interval: float = 10.0, max_retries: int = 6, max_backoff: float = 120.0,
+                 change_probe=None, max_idle_seconds: float = 1200.0):
+        self.sheet = sheet
+        self.lock = threading.RLock()
+        self.cursor = 2
+        self.scans = 0
+        self.full_rescan_every = full_rescan_every
+        self.batch_size = max(1, batch_size)
+        self.pending_writes = {}
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.last_call = 0.0
+        self.retry_not_before = 0.0
+        self.api_calls = 0
+        self.change_probe = change_probe
+        self.scan_token = None
+        self.idle_token = None
+        self.skipped_scans = 0
+        self.max_idle_seconds = max_idle_seconds
+        self.last_scan = time.monotonic()
+
+    # --- Pacing and retries ---
+
+    def _pace(self):
+        """Reserves the next call slot under the lock, then waits for it outside the lock."""
+        with self.lock:
+            slot = max(time.monotonic(), self.last_call + self.interval, self.retry_not_before)
+            self.last_call = slot
+        wait = slot - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def _call(self, fn, *args, **kwargs):
+        # Callers must not hold self.lock: a backoff then only delays Sheets calls (every thread waits
+        # for retry_not_before), never the gateway's bookkeeping or the other stages' local work.
+        attempt = 0
+        while True:
+            self._pace()
+            try:
+                with self.lock:
+                    self.api_calls += 1
+                with timing.span("sheets_api", call=fn.__name__):
+                    result = fn(*args, **kwargs)
+                # Ease the pacing back down after each success.
+                with self.lock:
+                    self.interval = max(self.min_interval, self.interval * 0.7)
+                return result
+            except gspread.exceptions.APIError as e:
+                status = _status_code(e)
+                if status not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                    raise
+                delay = _retry_after(e) or min(self.max_backoff, 2 ** attempt) * random.uniform(0.5, 1.5)
+                with self.lock:
+                    self.interval = min(self.max_interval, max(1.0, self.interval * 2))
+                    self.retry_not_before = max(self.retry_not_before, time.monotonic() + delay)
+                print(f"   -!- Sheets API returned {status}. Backing off {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})...")
+                attempt += 1
+
+    def cooldown(self) -> float:
+        """How long a caller should wait after a Sheets error escaped the retries."""
+        return min(self.max_backoff, max(5.0, self.interval * 10))
+
+    # --- Change detection ---
+
+    def _probe(self):
+        try:
+            with timing.span("sheet_change_probe"):
+                return self.change_probe()
+        except Exception as e:
+            print(f"   -!- Sheet change check failed: {e}. Scanning anyway...")
+            return None
+
+    def has_changed(self) -> bool:
+        """
+        False only when the change signal matches the one seen by the last scan that found nothing pending
+        and that scan is less than `max_idle_seconds` old.
+        """
+        with self.lock:
+            idle_token = self.idle_token
+            if idle_token is not None and time.monotonic() - self.last_scan >= self.max_idle_seconds:
+                # Rows behind the cursor may hold claims that went stale since; read them all again.
+                self.cursor = 2
+                self.idle_token = None
+                return True
+        if self.change_probe is None or idle_token is None:
+            return True
+        if self._probe() == idle_token:
+            with self.lock:
+                self.skipped_scans += 1
+            return False
+        with self.lock:
+            self.idle_token = None
+        return True
+
+    def mark_idle(self):
+        """Records that the latest scan found nothing pending, so scans can pause until the sheet changes."""
+        with self.lock:
+            self.idle_token = self.scan_token
+
+    # --- Reads ---
+
+    def scan_rows(self):
+        """Returns [(row_index, row)] from the scan cursor onwards and advances the cursor past finished rows."""
+        # Read the change signal before the rows, so an edit made during the scan still counts as a change.
+        scan_token = self._probe() if self.change_probe is not None else None
+        with self.lock:
+            self.scan_token = scan_token
+            self.idle_token = None
+            self.scans += 1
+            self.last_scan = time.monotonic()
+            if self.full_rescan_every and self.scans % self.full_rescan_every == 0:
+                self.cursor = 2
+            start = self.cursor
+        values = self._call(self.sheet.get, f"A{start}:{LAST_COL_LETTER}")
+        rows = [(start + offset, list(row)) for offset, row in enumerate(values)]
+        with self.lock:
+            for row_index, row in rows:
+                if len(row) >= 7 and str(row[6]).strip():
+                    self.cursor = row_index + 1
+                else:
+                    break
+        return rows
+
+    def read_status(self, row_index: int) -> str:
+        return self._call(self.sheet.acell, f"{STATUS_COL_LETTER}{row_index}").value or ""
+
+    # --- Writes ---
+
+    def write_status(self, row_index: int, status: str):
+        """Writes only the Status cell immediately (used for claim tokens)."""
+        self._call(self.sheet.update, values=[[status]], range_name=f"{STATUS_COL_LETTER}{row_index}")
+
+    def write_result(self, row_index: int, values: list):
+        """Queues a row's G:J values; flushed as one range update or as part of a batch."""
+        with self.lock:
+            self.pending_writes[f"{STATUS_COL_LETTER}{row_index}:{LAST_COL_LETTER}{row_index}"] = list(values)
+            full = len(self.pending_writes) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Writes all queued ranges: one range update for a single range, one batch_update for several."""
+        with self.lock:
+            if not self.pending_writes:
+                return
+            writes = list(self.pending_writes.items())
+            self.pending_writes = {}
+        try:
+            if len(writes) == 1:
+                range_name, values = writes[0]
+                self._call(self.sheet.update, values=[values], range_name=range_name)
+            else:
+                self._call(self.sheet.batch_update, [{"range": range_name, "values": [values]} for range_name, values in writes])
+        except Exception:
+            with self.lock:
+                # Put the writes back for the next flush; anything queued for the same range since is newer and wins.
+                for range_name, values in writes:
+                    self.pending_writes.setdefault(range_name, values)
+            raise
+        print(f"-> Wrote {len(writes)} pending range(s) in one Sheets call.")
@@ -30,7 +30,7 @@ def run_post_login_tasks(page: Page, patient_data: dict):
         payer_element = commercial_list_container.get_by_text(patient_data['payer_name'], exact=True)
         payer_element.wait_for(timeout=10000)
         payer_element.click()
-        page.wait_for_timeout(2000)
+        page.locator("#EligibilityRequestPayerInquiry_EligibilityRequestFieldValues_DateOfService").wait_for(state="visible", timeout=30000)
         
         # Fill Form
         page.locator("#EligibilityRequestPayerInquiry_EligibilityRequestFieldValues_DateOfService").fill(patient_data["dos"])
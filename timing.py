@@ -0,0 +1,195 @@
+# timing.py
+# Lightweight tracing spans per processed row, rolling p50/p95 per stage, and metrics export
+# to JSON lines (one record per row) and a Prometheus text file.
+
+import os
+import json
+import time
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+_local = threading.local()
+_lock = threading.Lock()
+_window = 200
+_samples = {}     # stage -> deque of recent durations
+_totals = {}      # stage -> [count, total_seconds]
+_attr_totals = {} # (stage, attribute) -> total of numeric span attributes, e.g. prompt_bytes
+_rows = {}        # outcome -> count
+_jsonl_path = None
+_prom_path = None
+
+
+def configure(jsonl_path: str = None, prom_path: str = None, window: int = 200):
+    """Sets where metrics are exported and how many recent samples the rolling quantiles use."""
+    global _jsonl_path, _prom_path, _window
+    _jsonl_path, _prom_path, _window = jsonl_path, prom_path, window
+    for path in (jsonl_path, prom_path):
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+
+def start_row(**attributes):
+    """Begins a trace for the row this thread is about to process (e.g. row=12, worker='worker-1')."""
+    _local.row = {"attributes": attributes, "started": time.perf_counter(), "wall_start": time.time(), "spans": [], "stages": {}}
+    _local.stack = []
+
+
+def tag_row(**attributes):
+    """Adds attributes (e.g. outcome='cached') to the current row trace."""
+    row = getattr(_local, "row", None)
+    if row is not None:
+        row["attributes"].update(attributes)
+
+
+def finish_row() -> dict:
+    """Closes the current row trace, exports it, and returns {stage: seconds}."""
+    row = getattr(_local, "row", None)
+    _local.row = None
+    if row is None:
+        return {}
+    total = time.perf_counter() - row["started"]
+    outcome = row["attributes"].pop("outcome", "ok")
+    with _lock:
+        _rows[outcome] = _rows.get(outcome, 0) + 1
+    record = {
+        "ts": row["wall_start"],
+        **row["attributes"],
+        "outcome": outcome,
+        "total_seconds": round(total, 4),
+        "stages": {name: round(seconds, 4) for name, seconds in row["stages"].items()},
+        "spans": row["spans"],
+    }
+    _export_row(record)
+    export_prometheus()
+    return row["stages"]
+
+
+def record(name: str, seconds: float, attributes: dict = None):
+    """Adds one stage sample to the aggregates (and to the current row, if any)."""
+    row = getattr(_local, "row", None)
+    if row is not None:
+        row["stages"][name] = row["stages"].get(name, 0.0) + seconds
+    with _lock:
+        _samples.setdefault(name, deque(maxlen=_window)).append(seconds)
+        totals = _totals.setdefault(name, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+        for key, value in (attributes or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                _attr_totals[(name, key)] = _attr_totals.get((name, key), 0) + value
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times the enclosed block as stage `name`; nested spans record their parent. Yields the
+    attribute dict so callers can add attributes (e.g. prompt_bytes) while the span is open.
+    """
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    stack.append(name)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        record(name, seconds, attributes)
+        row = getattr(_local, "row", None)
+        if row is not None:
+            entry = {"name": name, "parent": parent, "offset": round(start - row["started"], 4), "seconds": round(seconds, 4)}
+            if attributes:
+                entry["attributes"] = dict(attributes)
+            if error:
+                entry["error"] = error
+            row["spans"].append(entry)
+
+
+def traced(name: str):
+    """Decorator that wraps every call of the function in a span."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _quantile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def quantiles() -> dict:
+    """{stage: (p50, p95)} over each stage's rolling window."""
+    with _lock:
+        return {name: (_quantile(list(s), 0.5), _quantile(list(s), 0.95)) for name, s in _samples.items() if s}
+
+
+def totals() -> dict:
+    """{stage: (count, total_seconds)} since start-up."""
+    with _lock:
+        return {name: (count, total) for name, (count, total) in _totals.items()}
+
+
+def format_steps(steps: dict) -> str:
+    return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in steps.items()) or "none"
+
+
+def format_quantiles() -> str:
+    return ", ".join(f"{name} {p50:.2f}/{p95:.2f}s" for name, (p50, p95) in sorted(quantiles().items())) or "none"
+
+
+def _export_row(record: dict):
+    if not _jsonl_path:
+        return
+    try:
+        with _lock, open(_jsonl_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"   -!- Could not write row metrics: {e}")
+
+
+def export_prometheus():
+    """Rewrites the Prometheus text-format metrics file (for node_exporter's textfile collector)."""
+    if not _prom_path:
+        return
+    stage_quantiles = quantiles()
+    lines = [
+        "# HELP eligibility_bot_stage_seconds Stage latency in seconds; quantiles over a rolling window.",
+        "# TYPE eligibility_bot_stage_seconds summary",
+    ]
+    with _lock:
+        for name in sorted(_totals):
+            count, total = _totals[name]
+            if name in stage_quantiles:
+                p50, p95 = stage_quantiles[name]
+                lines.append(f'eligibility_bot_stage_seconds{{stage="{name}",quantile="0.5"}} {p50:.6f}')
+                lines.append(f'eligibility_bot_stage_seconds{{stage="{name}",quantile="0.95"}} {p95:.6f}')
+            lines.append(f'eligibility_bot_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'eligibility_bot_stage_seconds_count{{stage="{name}"}} {count}')
+        lines.append("# HELP eligibility_bot_span_attribute_total Sum of numeric span attributes such as prompt_bytes.")
+        lines.append("# TYPE eligibility_bot_span_attribute_total counter")
+        for (name, key), value in sorted(_attr_totals.items()):
+            lines.append(f'eligibility_bot_span_attribute_total{{stage="{name}",attribute="{key}"}} {value}')
+        lines.append("# HELP eligibility_bot_rows_total Rows processed, by outcome.")
+        lines.append("# TYPE eligibility_bot_rows_total counter")
+        for outcome, count in sorted(_rows.items()):
+            lines.append(f'eligibility_bot_rows_total{{outcome="{outcome}"}} {count}')
+    tmp_path = f"{_prom_path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, _prom_path)
+    except OSError as e:
+        print(f"   -!- Could not write Prometheus metrics: {e}")
@@ -0,0 +1,233 @@
+# work_journal.py
+# SQLite journal of claimed, in-flight and finished rows: the queue between sheet ingestion,
+# browser workers and result write-back, and the record that lets a restarted bot recover.
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from row_claims import owner_is_alive
+
+# queued    -> claimed on the sheet, waiting for a browser worker
+# leased    -> a worker is checking it; the lease must be renewed by heartbeats
+# completed -> result recorded, waiting to be written to the sheet
+# written   -> result is on the sheet (kept for JOURNAL_RETENTION_HOURS)
+# A lease's owner is "host:pid:run_id:worker"; run_id is new for every WorkJournal, so a restarted
+# container that gets the same hostname and PID back still never mistakes an old lease for its own.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    row_index   INTEGER PRIMARY KEY,
+    data        TEXT NOT NULL,
+    state       TEXT NOT NULL,
+    owner       TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    result      TEXT,
+    revision    INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rows_state ON rows (state);
+"""
+
+
+def _lease_is_orphaned(owner: str, current_run: str) -> bool:
+    """True for a lease held by an earlier run on this host: same PID (reused after a restart) or a dead one."""
+    parts = (owner or "").split(":", 3)
+    if len(parts) < 4 or not parts[1].isdigit():
+        return True
+    return not owner_is_alive(parts[0], int(parts[1]), parts[2], current_run)
+
+
+class WorkJournal:
+    """
+    Durable row queue shared by the ingestion thread, the browser workers and the write-back thread.
+    Workers lease rows for `lease_seconds` and renew the lease with heartbeats while they work;
+    rows whose lease ran out or whose run ended are handed out again, up to `max_attempts` times.
+    handle_row records results here with write_result/write_link; the write-back thread copies them to the sheet.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300, heartbeat_seconds: float = 60,
+                 max_attempts: int = 3, scheduler=None):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.max_attempts = max_attempts
+        self.scheduler = scheduler
+        self.run_id = uuid.uuid4().hex[:12]
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{self.run_id}"
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    # --- Recovery ---
+
+    def recover(self, retention_seconds: float = 86400) -> dict:
+        """
+        Run once at start-up, before the workers: puts rows leased by an earlier run on this host straight
+        back in the queue from their journalled data, keeping their attempt counts, and prunes old written rows.
+        Queued rows need nothing; a lease held by another live bot process sharing this file is taken over
+        only once it expires.
+        Completed rows are kept so the write-back thread still writes their results.
+        """
+        now = time.time()
+        counts = {"requeued": 0, "unwritten": 0, "pruned": 0}
+        with self._transaction() as db:
+            # 'orphaned' is what earlier versions of this journal marked such rows with.
+            for row_index, state, owner in db.execute(
+                    "SELECT row_index, state, owner FROM rows WHERE state IN ('leased', 'orphaned')").fetchall():
+                if state == "orphaned" or _lease_is_orphaned(owner, self.run_id):
+                    db.execute("UPDATE rows SET state = 'queued', owner = NULL, lease_until = NULL, updated_at = ? "
+                               "WHERE row_index = ?", (now, row_index))
+                    counts["requeued"] += 1
+            counts["unwritten"] = db.execute("SELECT COUNT(*) FROM rows WHERE state = 'completed'").fetchone()[0]
+            counts["pruned"] = db.execute("DELETE FROM rows WHERE state = 'written' AND updated_at < ?",
+                                          (now - retention_seconds,)).rowcount
+        return counts
+
+    # --- Ingestion ---
+
+    def enqueue(self, row_index: int, row: list) -> bool:
+        """Queues a row just claimed on the sheet; returns False if it is already in flight here."""
+        now = time.time()
+        with self._transaction() as db:
+            existing = db.execute("SELECT state FROM rows WHERE row_index = ?", (row_index,)).fetchone()
+            if existing and existing[0] in ("leased", "completed"):
+                return False
+            if existing:
+                # A row reused after its result was written starts over.
+                db.execute("UPDATE rows SET data = ?, state = 'queued', owner = NULL, lease_until = NULL, "
+                           "attempts = 0, result = NULL, revision = revision + 1, enqueued_at = ?, updated_at = ? "
+                           "WHERE row_index = ?", (json.dumps(row[:6]), now, now, row_index))
+            else:
+                db.execute("INSERT INTO rows (row_index, data, state, enqueued_at, updated_at) "
+                           "VALUES (?, ?, 'queued', ?, ?)", (row_index, json.dumps(row[:6]), now, now))
+            return True
+
+    def backlog(self) -> int:
+        """Rows claimed but not yet picked up by a worker."""
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM rows WHERE state = 'queued'").fetchone()[0]
+
+    def active_rows(self) -> set:
+        """Row indexes queued, leased or awaiting write-back, which ingestion must not claim again."""
+        with self.lock:
+            return {r[0] for r in self.db.execute("SELECT row_index FROM rows WHERE state IN ('queued', 'leased', 'completed')")}
+
+    # --- Browser workers ---
+
+    def lease_next(self, worker_name: str, current_payer: str = None, streak: int = 0):
+        """
+        Leases the next row for a worker (payer-grouped when a scheduler is set), or returns (None, None).
+        Rows that already used up `max_attempts` leases are completed with an error instead.
+        """
+        owner = f"{self.owner}:{worker_name}"
+        now = time.time()
+        with self._transaction() as db:
+            available = [
+                (row_index, json.loads(data), attempts, enqueued_at)
+                for row_index, data, attempts, enqueued_at in db.execute(
+                    "SELECT row_index, data, attempts, enqueued_at FROM rows WHERE state = 'queued' "
+                    "OR (state = 'leased' AND lease_until < ?) ORDER BY enqueued_at, row_index", (now,))
+            ]
+            for row_index, _, attempts, _ in [item for item in available if item[2] >= self.max_attempts]:
+                print(f"   -!- Row {row_index} failed {attempts} time(s). Giving up on it.")
+                result = [f"Error: gave up after {attempts} attempts", "The bot stopped while checking this row.", "", "N/A"]
+                db.execute("UPDATE rows SET state = 'completed', owner = NULL, lease_until = NULL, result = ?, "
+                           "revision = revision + 1, updated_at = ? WHERE row_index = ?", (json.dumps(result), now, row_index))
+            pending = [(row_index, row) for row_index, row, attempts, _ in available if attempts < self.max_attempts]
+            if not pending:
+                return None, None
+            if self.scheduler is not None:
+                enqueued_at = {row_index: queued for row_index, _, _, queued in available}
+                pending = self.scheduler.order(pending, current_payer, streak, enqueued_at)
+            row_index, row = pending[0]
+            db.execute("UPDATE rows SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                       "WHERE row_index = ?", (owner, now + self.lease_seconds, now, row_index))
+            return row_index, row
+
+    def heartbeat(self, row_index: int, worker_name: str) -> bool:
+        """Renews a worker's lease; False if the lease was lost."""
+        now = time.time()
+        with self._transaction() as db:
+            return db.execute("UPDATE rows SET lease_until = ?, updated_at = ? WHERE row_index = ? AND state = 'leased' AND owner = ?",
+                              (now + self.lease_seconds, now, row_index, f"{self.owner}:{worker_name}")).rowcount > 0
+
+    @contextmanager
+    def keep_alive(self, row_index: int, worker_name: str):
+        """Heartbeats the lease on a background thread for as long as the block runs."""
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(self.heartbeat_seconds):
+                if not self.heartbeat(row_index, worker_name):
+                    print(f"   -!- [{worker_name}] Lost the lease on row {row_index}.")
+                    return
+
+        thread = threading.Thread(target=beat, name=f"heartbeat-{row_index}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+
+    def write_result(self, row_index: int, values: list, worker_name: str) -> bool:
+        """
+        Records a row's G:J values for the write-back thread; False (and nothing recorded) if the
+        worker's lease ran out and the row was handed to another worker in the meantime.
+        """
+        with self._transaction() as db:
+            return db.execute("UPDATE rows SET state = 'completed', owner = NULL, lease_until = NULL, result = ?, "
+                              "revision = revision + 1, updated_at = ? WHERE row_index = ? AND state = 'leased' AND owner = ?",
+                              (json.dumps(list(values)), time.time(), row_index, f"{self.owner}:{worker_name}")).rowcount > 0
+
+    def write_link(self, row_index: int, link: str):
+        """Sets the screenshot link (column J); a row already written is queued for write-back again."""
+        with self._transaction() as db:
+            found = db.execute("SELECT result FROM rows WHERE row_index = ? AND state IN ('completed', 'written')", (row_index,)).fetchone()
+            if not found or not found[0]:
+                return
+            result = json.loads(found[0])
+            result[-1] = link
+            db.execute("UPDATE rows SET state = 'completed', result = ?, revision = revision + 1, updated_at = ? "
+                       "WHERE row_index = ?", (json.dumps(result), time.time(), row_index))
+
+    # --- Write-back ---
+
+    def completed_rows(self) -> list:
+        """[(row_index, values, revision)] waiting to be written to the sheet."""
+        with self.lock:
+            return [(row_index, json.loads(result), revision) for row_index, result, revision in self.db.execute(
+                "SELECT row_index, result, revision FROM rows WHERE state = 'completed' ORDER BY row_index")]
+
+    def mark_written(self, row_index: int, revision: int) -> bool:
+        """Marks a row written unless its result changed (e.g. a link arrived) after it was read."""
+        with self._transaction() as db:
+            return db.execute("UPDATE rows SET state = 'written', updated_at = ? WHERE row_index = ? AND revision = ?",
+                              (time.time(), row_index, revision)).rowcount > 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.db.execute("SELECT state, COUNT(*) FROM rows GROUP BY state").fetchall())
+
+    def close(self):
+        with self.lock:
+            self.db.close()